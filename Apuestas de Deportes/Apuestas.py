@@ -2,10 +2,20 @@
 # Hecho por Eduardo Huamani
 
 import os
+import sys
 import numpy as np
 import pandas as pd
+from time import perf_counter
 import matplotlib.pyplot as plt
-from scipy.optimize import minimize
+from scipy import sparse
+from scipy.optimize import minimize, OptimizeResult
+from scipy.sparse.linalg import splu
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+# Agregar la carpeta padre al path para poder importar módulos desde allí
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Conexiones.lectura_excel import leer_excel
 
 # =====================================
 # 1. RUTAS Y PARÁMETROS
@@ -20,53 +30,162 @@ archivo_png = os.path.join(base_dir, 'Flujo', 'output', 'Frontera_Eficiente_Port
 
 MONTO = 100   # monto total a invertir
 N_RANDOM = 10000  # número de portafolios aleatorios para la nube
+METODO_NUBE = 'uniforme'  # 'uniforme' (uniformes normalizados) o 'dirichlet' (uniforme sobre el simplex)
+TAMANO_LOTE_NUBE = 100_000  # portafolios por lote (acota la memoria de la matriz de pesos)
+MAX_PUNTOS_GRAFICO = 50_000  # puntos de la nube que se dibujan (muestra aleatoria si hay más)
+SEMILLA = None  # semilla de la nube (None = distinta en cada corrida)
+N_FRONTERA = 50  # puntos de la frontera eficiente
+N_PROCESOS = 1  # procesos para la frontera y los portafolios tipo (1 = en serie; conviene con cientos de apuestas)
+CORRELACION_EVENTO = 0.3  # correlación entre apuestas del mismo partido (columna opcional 'Evento')
+CORRELACION_LIGA = 0.05  # correlación adicional entre apuestas de la misma liga (columna opcional 'Liga')
+CAMBIOS_CUOTAS = {}  # p. ej. {'Gana Brasil': 2.10}: al final se re-optimiza en caliente con estas cuotas
+EJECUTAR_BENCHMARK = False  # compara las versiones originales (bucle, penalización) con las nuevas
 
 
 # =====================================
-# 2. LECTURA DEL EXCEL
+# 2. FUNCIONES DE PORTAFOLIO Y OPTIMIZACIÓN
 # =====================================
 
-df = pd.read_excel(archivo_entrada)
-
-if 'Descripcion' not in df.columns or 'Cuota' not in df.columns:
-    raise ValueError("El Excel debe tener columnas: 'Descripcion' y 'Cuota'.")
-
-nombres_apuestas = df['Descripcion'].astype(str)
-odds = df['Cuota'].astype(float).to_numpy()
-
-# Rentabilidad = Cuota - 1  (único escenario: si se acierta)
-mu = odds - 1  # (n_apuestas,)
+def varianzas_apuestas(mu):
+    """
+    Riesgo artificial de cada apuesta: volatilidad de la mitad de su rentabilidad, con un
+    mínimo del 10%. Sigma es diagonal y se guarda solo como el vector de varianzas.
+    """
+    base_vol = np.maximum(0.10, 0.5 * np.abs(mu))  # vol mínima del 10%
+    return base_vol**2
+
+
+class CovarianzaFactorial:
+    """
+    Sigma = B B' + diag(d): k factores comunes (B, de n x k, densa o dispersa) más el riesgo
+    propio de cada apuesta (d > 0). Sigma nunca se arma: Sigma @ x cuesta O(n k) (O(n) si B
+    es dispersa, como con los factores por evento y liga) y los sistemas con Sigma_FF se
+    resuelven con la identidad de Woodbury, que solo factoriza una matriz de k x k.
+    """
+
+    def __init__(self, B, d):
+        self.B = B
+        self.d = np.asarray(d, dtype=float)
+        if np.any(self.d <= 0):
+            raise ValueError("El riesgo propio (d) de cada apuesta debe ser positivo.")
+
+    def producto(self, x):
+        """Sigma @ x para un vector o una matriz de pesos por filas."""
+        return x * self.d + (self.B @ (self.B.T @ x.T)).T
+
+    def resolver(self, F, V):
+        """
+        Sigma_FF^-1 V con Woodbury:
+        D^-1 V - D^-1 B_F (I + B_F' D^-1 B_F)^-1 B_F' D^-1 V.
+        """
+        B_F = self.B[F]
+        inv_d = 1.0 / self.d[F]
+        DV = V * inv_d[:, None]
+        if sparse.issparse(B_F):
+            C = sparse.identity(B_F.shape[1], format='csc') + (B_F.T @ sparse.diags(inv_d) @ B_F).tocsc()
+            # C es simétrica definida positiva: orden de mínimo grado sobre C sin pivoteo (con el
+            # orden por defecto la factorización de eventos + ligas se llena y es ~10x más lenta)
+            lu = splu(C, permc_spec='MMD_AT_PLUS_A', diag_pivot_thresh=0.0,
+                      options={'SymmetricMode': True})
+            Y = lu.solve(np.asarray(B_F.T @ DV))
+        else:
+            C = np.eye(B_F.shape[1]) + (B_F.T * inv_d) @ B_F
+            Y = np.linalg.solve(C, B_F.T @ DV)
+        return DV - inv_d[:, None] * (B_F @ Y)
+
+    def reescalar(self, idx, factor_vol):
+        """Multiplica la volatilidad de las apuestas `idx` (cargas por factor_vol, d por su cuadrado)."""
+        if sparse.issparse(self.B):
+            for i, f in zip(idx, factor_vol):
+                self.B.data[self.B.indptr[i]:self.B.indptr[i + 1]] *= f
+        else:
+            self.B[idx] *= np.asarray(factor_vol)[:, None]
+        self.d[idx] *= np.asarray(factor_vol)**2
+
+    def matriz(self):
+        """Sigma completa (solo para revisar resultados con pocas apuestas)."""
+        BBt = self.B @ self.B.T
+        return (BBt.toarray() if sparse.issparse(BBt) else BBt) + np.diag(self.d)
+
+    def componentes(self):
+        """Arreglos que definen la covarianza (para compartirlos entre procesos)."""
+        if sparse.issparse(self.B):
+            B = sparse.csr_matrix(self.B)
+            return {'d': self.d, 'datos': B.data, 'indices': B.indices, 'punteros': B.indptr,
+                    'forma': np.array(B.shape)}
+        return {'d': self.d, 'B': self.B}
+
+    @classmethod
+    def desde_componentes(cls, c):
+        if 'B' in c:
+            return cls(c['B'], c['d'])
+        B = sparse.csr_matrix((c['datos'], c['indices'], c['punteros']), shape=tuple(c['forma']), copy=False)
+        return cls(B, c['d'])
+
+
+def covarianza_apuestas(mu, eventos=None, ligas=None, rho_evento=0.0, rho_liga=0.0):
+    """
+    Sigma de las apuestas con el riesgo artificial de varianzas_apuestas(). Sin grupos es
+    diagonal (vector de varianzas). Con `eventos` y/o `ligas` (una etiqueta por apuesta;
+    celda vacía = sin grupo) se agrega un factor por grupo con carga sqrt(rho) * vol, así que
+    dos apuestas del mismo evento tienen correlación rho_evento (más rho_liga si comparten
+    liga) y la varianza total de cada apuesta no cambia.
+    """
+    varianzas = varianzas_apuestas(mu)
+    grupos = [(etiquetas, rho) for etiquetas, rho in ((eventos, rho_evento), (ligas, rho_liga))
+              if etiquetas is not None and rho > 0]
+    if not grupos:
+        return varianzas
+    if sum(rho for _, rho in grupos) >= 1:
+        raise ValueError("La suma de las correlaciones por evento y liga debe ser menor que 1.")
 
-n_assets = len(mu)
-if n_assets < 2:
-    raise ValueError("Se requieren al menos 2 apuestas para formar un portafolio.")
-
-# Matriz de riesgo artificial (diagonal) para poder construir portafolios
-base_vol = np.maximum(0.10, 0.5 * np.abs(mu))  # vol mínima del 10%
-Sigma = np.diag(base_vol**2)
+    n = len(mu)
+    vol = np.sqrt(varianzas)
+    filas, columnas, cargas, k = [], [], [], 0
+    for etiquetas, rho in grupos:
+        codigos, niveles = pd.factorize(pd.Series(etiquetas).reset_index(drop=True))
+        con_grupo = np.flatnonzero(codigos >= 0)
+        filas.append(con_grupo)
+        columnas.append(k + codigos[con_grupo])
+        cargas.append(np.sqrt(rho) * vol[con_grupo])
+        k += len(niveles)
+    B = sparse.csr_matrix((np.concatenate(cargas), (np.concatenate(filas), np.concatenate(columnas))),
+                          shape=(n, k))
+    d = varianzas - np.asarray(B.multiply(B).sum(axis=1)).ravel()
+    return CovarianzaFactorial(B, d)
+
+
+def producto_sigma(Sigma, x):
+    """
+    Sigma @ x para un vector de pesos o una matriz de pesos por filas. Sigma puede ser la
+    matriz completa, el vector de varianzas si es diagonal (O(n)) o una CovarianzaFactorial
+    (O(n k)).
+    """
+    if isinstance(Sigma, CovarianzaFactorial):
+        return Sigma.producto(x)
+    if np.ndim(Sigma) == 1:
+        return x * Sigma
+    return x @ Sigma
 
-# =====================================
-# 3. FUNCIONES DE PORTAFOLIO Y OPTIMIZACIÓN
-# =====================================
 
 def portafolio_stats(weights, mu, Sigma):
     """Devuelve rendimiento esperado y desviación estándar (riesgo)."""
     w = np.array(weights)
     exp_ret = np.dot(w, mu)
-    var = np.dot(w.T, np.dot(Sigma, w))
+    var = np.dot(w, producto_sigma(Sigma, w))
     std = np.sqrt(var)
     return exp_ret, std
 
 
 def objetivo_min_var(weights, mu, Sigma, target_return):
-    """Minimiza la varianza penalizando alejarse del retorno objetivo."""
+    """Minimiza la varianza penalizando alejarse del retorno objetivo (versión original)."""
     exp_ret, std = portafolio_stats(weights, mu, Sigma)
     penalty = 1000.0 * (exp_ret - target_return)**2
     return std**2 + penalty
 
 
-def optimizar_para_retorno(target_return, mu, Sigma):
-    """Portafolio de mínima varianza para un retorno objetivo."""
+def optimizar_para_retorno_penalizado(target_return, mu, Sigma):
+    """Versión original: penalización, gradientes numéricos y arranque en pesos iguales (benchmark)."""
     n = len(mu)
     w0 = np.ones(n) / n
 
@@ -82,187 +201,645 @@ def optimizar_para_retorno(target_return, mu, Sigma):
     return res
 
 
-def portafolio_min_var(mu, Sigma):
-    # Portafolio conservador
-    n = len(mu)
-    w0 = np.ones(n) / n
-    cons = ({'type': 'eq', 'fun': lambda w: np.sum(w) - 1.0})
-    bounds = tuple((0, 1) for _ in range(n))
-    res = minimize(lambda w: portafolio_stats(w, mu, Sigma)[1]**2,
-                   w0,
-                   method='SLSQP',
-                   bounds=bounds,
-                   constraints=cons)
-    return res
+def varianza_y_gradiente(weights, Sigma):
+    """w' Sigma w y su gradiente exacto 2 Sigma w (un solo producto matriz-vector)."""
+    Sw = producto_sigma(Sigma, weights)
+    return weights @ Sw, 2.0 * Sw
 
 
-def portafolio_max_return(mu, Sigma):
-    # Portafolio agresivo
+# Restricción de presupuesto (sum w = 1) con su jacobiano
+RESTRICCION_SUMA = {'type': 'eq',
+                    'fun': lambda w: np.sum(w) - 1.0,
+                    'jac': lambda w: np.ones_like(w)}
+
+
+def optimizar_para_retorno(target_return, mu, Sigma, w0=None):
+    """
+    Portafolio de mínima varianza (solo posiciones largas) con retorno exactamente igual al
+    objetivo: mu'w = target como restricción de igualdad, no como penalización, y gradientes
+    analíticos. `w0` permite arrancar desde una solución cercana (p. ej. el punto anterior
+    de la frontera); por defecto, pesos iguales.
+    """
     n = len(mu)
-    w0 = np.ones(n) / n
-    cons = ({'type': 'eq', 'fun': lambda w: np.sum(w) - 1.0})
+    if w0 is None:
+        w0 = np.ones(n) / n
+
+    cons = (RESTRICCION_SUMA,
+            {'type': 'eq',
+             'fun': lambda w: np.dot(w, mu) - target_return,
+             'jac': lambda w: mu})
     bounds = tuple((0, 1) for _ in range(n))
-    res = minimize(lambda w: -np.dot(w, mu),
+
+    res = minimize(varianza_y_gradiente,
                    w0,
+                   args=(Sigma,),
+                   jac=True,
                    method='SLSQP',
                    bounds=bounds,
-                   constraints=cons)
+                   constraints=cons,
+                   options={'ftol': 1e-12, 'maxiter': 500})
     return res
 
 
-# =====================================
-# 4. PORTAFOLIOS ALEATORIOS (NUBE)
-# =====================================
-
-rand_returns = []
-rand_risks = []
-rand_sharpes = []
-
-for _ in range(N_RANDOM):
-    w = np.random.rand(n_assets)
-    w /= w.sum()
-    r, s = portafolio_stats(w, mu, Sigma)
-    rand_returns.append(r)
-    rand_risks.append(s)
-    rand_sharpes.append(r / s)
-
-rand_returns = np.array(rand_returns)
-rand_risks = np.array(rand_risks)
-rand_sharpes = np.array(rand_sharpes)
-
-
-# =====================================
-# 5. FRONTERA EFICIENTE (LÍNEA)
-# =====================================
-
-min_ret = float(mu.min())
-max_ret = float(mu.max())
-
-if np.isclose(min_ret, max_ret):
-    raise ValueError("Todas las rentabilidades son iguales. "
-                     "No se puede construir una frontera eficiente.")
-
-target_returns = np.linspace(min_ret, max_ret, 50)
-
-frontier_returns = []
-frontier_risks = []
-frontier_weights = []
-
-for r_target in target_returns:
-    r = optimizar_para_retorno(r_target, mu, Sigma)
-    if r.success:
-        w = r.x
+def qp_conjunto_activo(target_return, mu, Sigma, libres, max_iter=None, tol=1e-10, pasos_en_bloque=20):
+    """
+    Resuelve min w'Sigma w con sum w = 1, mu'w = target y w >= 0 por conjunto activo.
+    Con las apuestas `libres` (máscara booleana) fijas como las únicas con peso, las
+    condiciones KKT son el sistema lineal
+        [Sigma_FF  -A_F'] [w_F]   [0]
+        [A_F        0   ] [lam] = [b],   A = [1; mu'],  b = [1; target]
+    y la solución es óptima si w_F >= 0 y los multiplicadores de las fijas en cero,
+    (Sigma w - A'lam)_i, son >= 0. Si no, se sacan las libres negativas o se liberan las fijas
+    que violan, todas a la vez; si tras `pasos_en_bloque` pasos no converge (puede ciclar) se
+    sigue de a una (la libre más negativa o la fija que más viola). Arrancando con las libres del punto vecino de la frontera
+    suele bastar una o dos iteraciones. Con `target_return=None` solo se impone sum w = 1
+    (mínima varianza global). Si Sigma es diagonal (vector de varianzas) o factorial, el
+    sistema se reduce a uno de 2x2: w_F = X lam con X = Sigma_FF^-1 A_F' y (A_F X) lam = b.
+    Devuelve (pesos, libres), o (None, None) si el sistema es singular o no converge
+    (entonces se usa SLSQP).
+    """
+    n = len(mu)
+    libres = libres.copy()
+    permitidas = np.ones(n, dtype=bool)
+    escala = tol * max(1.0, np.abs(mu).max())
+    if target_return is not None:
+        # En los extremos (retorno = min o max de mu) solo sirven las apuestas con ese
+        # rendimiento y con ellas mu'w = target se cumple solo; si no, el sistema es singular
+        for extremo in (mu.min(), mu.max()):
+            if abs(target_return - extremo) <= escala:
+                permitidas = np.abs(mu - extremo) <= escala
+                libres = permitidas.copy()
+                target_return = None
+                break
+    if target_return is None:
+        A, b = np.ones((1, n)), np.ones(1)
+    else:
+        A, b = np.vstack([np.ones(n), mu]), np.array([1.0, target_return])
+    m = len(b)
+    max_iter = max_iter or 2 * n
+    for paso in range(max_iter):
+        en_bloque = paso < pasos_en_bloque
+        F = np.flatnonzero(libres)
+        k = len(F)
+        if k == 0:
+            return None, None
+        if m == 2 and np.ptp(mu[F]) <= escala:
+            # Libres con un mismo rendimiento (p. ej. viniendo de un extremo): se arranca de nuevo
+            libres = permitidas.copy()
+            continue
+        if isinstance(Sigma, CovarianzaFactorial) or np.ndim(Sigma) == 1:
+            A_F = A[:, F]
+            try:
+                if isinstance(Sigma, CovarianzaFactorial):
+                    X = Sigma.resolver(F, A_F.T)
+                else:
+                    X = A_F.T / Sigma[F][:, None]
+                lam = np.linalg.solve(A_F @ X, b)
+            except (np.linalg.LinAlgError, RuntimeError):
+                return None, None
+            w_F = X @ lam
+        else:
+            KKT = np.zeros((k + m, k + m))
+            KKT[:k, :k] = Sigma[np.ix_(F, F)]
+            KKT[:k, k:] = -A[:, F].T
+            KKT[k:, :k] = A[:, F]
+            try:
+                sol = np.linalg.solve(KKT, np.concatenate([np.zeros(k), b]))
+            except np.linalg.LinAlgError:
+                return None, None
+            w_F, lam = sol[:k], sol[k:]
+        if not (np.all(np.isfinite(w_F)) and np.all(np.isfinite(lam))):
+            return None, None
+        if w_F.min() < -tol:
+            libres[F[w_F < -tol] if en_bloque else F[np.argmin(w_F)]] = False
+            continue
+        w = np.zeros(n)
+        w[F] = np.maximum(w_F, 0.0)
+        nu = producto_sigma(Sigma, w) - A.T @ lam
+        nu[F] = 0.0
+        nu[~permitidas] = np.inf
+        violan = nu < -tol * max(1.0, np.abs(nu[np.isfinite(nu)]).max())
+        if violan.any():
+            libres[violan if en_bloque else np.argmin(nu)] = True
+            continue
+        return w, libres
+    return None, None
+
+
+def frontera_eficiente(target_returns, mu, Sigma, pesos_previos=None):
+    """
+    Traza la frontera resolviendo los objetivos en orden y arrancando cada uno desde la
+    solución del anterior (las apuestas con peso cambian poco entre objetivos vecinos):
+    primero por conjunto activo y, si este falla, con SLSQP desde los pesos anteriores y
+    luego desde pesos iguales. Con `pesos_previos` (una fila por objetivo, p. ej. la frontera
+    antes de un cambio de cuotas) cada objetivo arranca desde su propia solución anterior.
+    Los objetivos sin solución se omiten. Devuelve (rendimientos, riesgos, pesos).
+    """
+    frontier_returns = []
+    frontier_risks = []
+    frontier_weights = []
+
+    if pesos_previos is not None and len(pesos_previos) != len(target_returns):
+        pesos_previos = None
+    w_prev = None
+    libres = np.ones(len(mu), dtype=bool)
+    for i, r_target in enumerate(target_returns):
+        if pesos_previos is not None:
+            w_prev = pesos_previos[i]
+            libres = w_prev > 0
+        w, libres_nuevas = qp_conjunto_activo(r_target, mu, Sigma, libres)
+        if w is None:
+            r = optimizar_para_retorno(r_target, mu, Sigma, w_prev)
+            if not r.success and w_prev is not None:
+                r = optimizar_para_retorno(r_target, mu, Sigma)
+            if not r.success:
+                continue
+            w = np.clip(r.x, 0.0, None)
+            w /= w.sum()
+            libres_nuevas = w > 1e-8
+        libres = libres_nuevas
         exp_ret, std = portafolio_stats(w, mu, Sigma)
         frontier_returns.append(exp_ret)
         frontier_risks.append(std)
         frontier_weights.append(w)
+        w_prev = w
 
-frontier_returns = np.array(frontier_returns)
-frontier_risks = np.array(frontier_risks)
-frontier_weights = np.array(frontier_weights)
+    return np.array(frontier_returns), np.array(frontier_risks), np.array(frontier_weights)
 
-if len(frontier_returns) == 0:
-    raise RuntimeError("No se pudo trazar la frontera eficiente.")
 
+def portafolio_min_var(mu, Sigma, w0=None):
+    # Portafolio conservador: conjunto activo (arrancando desde las apuestas con peso en `w0`)
+    # y SLSQP si este falla
+    n = len(mu)
+    libres = np.ones(n, dtype=bool) if w0 is None else w0 > 0
+    w, _ = qp_conjunto_activo(None, mu, Sigma, libres)
+    if w is not None:
+        return OptimizeResult(x=w, fun=varianza_y_gradiente(w, Sigma)[0], success=True,
+                              message='Conjunto activo')
+    w0 = np.ones(n) / n if w0 is None else w0
+    bounds = tuple((0, 1) for _ in range(n))
+    res = minimize(varianza_y_gradiente,
+                   w0,
+                   args=(Sigma,),
+                   jac=True,
+                   method='SLSQP',
+                   bounds=bounds,
+                   constraints=RESTRICCION_SUMA,
+                   options={'ftol': 1e-12, 'maxiter': 500})
+    return res
 
-# =====================================
-# 6. TRES TIPOS DE INVERSIONISTA
-# =====================================
 
-# 6.1 Conservador: mínima varianza
-res_cons = portafolio_min_var(mu, Sigma)
-w_cons = res_cons.x
-ret_cons, risk_cons = portafolio_stats(w_cons, mu, Sigma)
-montos_cons = w_cons * MONTO
+def portafolio_max_return(mu, Sigma):
+    # Portafolio agresivo: todo en la apuesta de mayor rentabilidad (si hay empates, la
+    # combinación de menor varianza entre ellas); SLSQP solo si el conjunto activo falla
+    n = len(mu)
+    w, _ = qp_conjunto_activo(mu.max(), mu, Sigma, np.ones(n, dtype=bool))
+    if w is not None:
+        return OptimizeResult(x=w, fun=-np.dot(w, mu), success=True, message='Conjunto activo')
+    w0 = np.ones(n) / n
+    bounds = tuple((0, 1) for _ in range(n))
+    res = minimize(lambda w: -np.dot(w, mu),
+                   w0,
+                   jac=lambda w: -mu,
+                   method='SLSQP',
+                   bounds=bounds,
+                   constraints=RESTRICCION_SUMA)
+    return res
 
-# 6.2 Moderado: máximo Sharpe sobre la frontera
-sharpe_frontier = frontier_returns / frontier_risks
-idx_best = np.argmax(sharpe_frontier)
-w_mod = frontier_weights[idx_best]
-ret_mod = frontier_returns[idx_best]
-risk_mod = frontier_risks[idx_best]
-montos_mod = w_mod * MONTO
 
-# 6.3 Agresivo: máximo rendimiento esperado
-res_agr = portafolio_max_return(mu, Sigma)
-w_agr = res_agr.x
-ret_agr, risk_agr = portafolio_stats(w_agr, mu, Sigma)
-montos_agr = w_agr * MONTO
+def benchmark_frontera(target_returns, mu, Sigma):
+    """Tiempo y varianza media de la frontera original (penalización, en frío) contra la exacta."""
+    inicio = perf_counter()
+    pesos_penalizados = [optimizar_para_retorno_penalizado(t, mu, Sigma).x for t in target_returns]
+    t_original = perf_counter() - inicio
+    inicio = perf_counter()
+    _, riesgos, pesos = frontera_eficiente(target_returns, mu, Sigma)
+    t_nuevo = perf_counter() - inicio
+    df_benchmark = pd.DataFrame({
+        'Metodo': ['Penalizacion_en_frio', 'Exacto_en_caliente'],
+        'Puntos': [len(pesos_penalizados), len(pesos)],
+        'Tiempo_s': [t_original, t_nuevo],
+        'Error_max_retorno': [max(abs(w @ mu - t) for w, t in zip(pesos_penalizados, target_returns)),
+                              float(np.max(np.abs(pesos @ mu - target_returns[:len(pesos)])))
+                              if len(pesos) == len(target_returns) else np.nan],
+        'Varianza_media': [np.mean([portafolio_stats(w, mu, Sigma)[1]**2 for w in pesos_penalizados]),
+                           np.mean(riesgos**2)],
+    })
+    print("\n===== BENCHMARK FRONTERA EFICIENTE =====")
+    print(df_benchmark.to_string(index=False))
+    return df_benchmark
 
 
 # =====================================
-# 7. PRINT DE RESULTADOS
+# 3. FUNCIONES DE LA NUBE DE PORTAFOLIOS
 # =====================================
 
-def imprimir_portafolio(nombre_tipo, w, montos, ret, risk):
-    print(f"\n===== PORTAFOLIO {nombre_tipo} =====")
-    for n, wi, mi in zip(nombres_apuestas, w, montos):
-        print(f"Apuesta: {n:25s}  Peso: {wi:6.3f}  Monto: {mi:8.2f}")
-    print(f"Rendimiento esperado: {ret*100:6.2f}%")
-    ganancia = MONTO * ret
-    print(f"Ganancia esperada: {ganancia:.2f}")
-
-imprimir_portafolio("CONSERVADOR", w_cons, montos_cons, ret_cons, risk_cons)
-imprimir_portafolio("MODERADO", w_mod, montos_mod, ret_mod, risk_mod)
-imprimir_portafolio("AGRESIVO", w_agr, montos_agr, ret_agr, risk_agr)
-
-print(f"\nMONTO total utilizado: {MONTO:.2f}")
+def nube_bucle(n_portafolios, mu, Sigma, rng=None):
+    """Nube con un portafolio por iteración (versión original, se usa en el benchmark)."""
+    rng = np.random.default_rng(rng)
+    rand_returns, rand_risks = [], []
+    for _ in range(n_portafolios):
+        w = rng.random(len(mu))
+        w /= w.sum()
+        r, s = portafolio_stats(w, mu, Sigma)
+        rand_returns.append(r)
+        rand_risks.append(s)
+    rand_returns = np.array(rand_returns)
+    rand_risks = np.array(rand_risks)
+    return rand_returns, rand_risks, rand_returns / rand_risks
+
+
+def pesos_aleatorios(n_portafolios, n_activos, metodo='uniforme', rng=None):
+    """
+    Matriz (n_portafolios, n_activos) de pesos que suman 1.
+    'uniforme': uniformes normalizados (como el bucle original).
+    'dirichlet': Dirichlet(1, ..., 1), uniforme sobre el simplex (exponenciales normalizadas).
+    """
+    rng = np.random.default_rng(rng)
+    if metodo == 'uniforme':
+        W = rng.random((n_portafolios, n_activos))
+    elif metodo == 'dirichlet':
+        W = rng.standard_exponential((n_portafolios, n_activos))
+    else:
+        raise ValueError(f"Método de nube desconocido: '{metodo}'. Use 'uniforme' o 'dirichlet'.")
+    W /= W.sum(axis=1, keepdims=True)
+    return W
+
+
+def nube_portafolios(n_portafolios, mu, Sigma, metodo='uniforme', tamano_lote=100_000, rng=None):
+    """
+    Rendimiento, riesgo y Sharpe de `n_portafolios` portafolios aleatorios con productos
+    matriciales: por lote, W @ mu da los rendimientos y la suma por fila de (W @ Sigma) * W
+    las varianzas (W * varianzas si Sigma es diagonal). Solo un lote de pesos vive en memoria a la vez, así que 10^6–10^7
+    portafolios cuestan lo mismo que tres vectores de resultados.
+    Devuelve (rendimientos, riesgos, sharpes, pesos del portafolio de mayor Sharpe).
+    """
+    rng = np.random.default_rng(rng)
+    rand_returns = np.empty(n_portafolios)
+    rand_risks = np.empty(n_portafolios)
+    mejor_sharpe, mejores_pesos = -np.inf, None
+    for inicio in range(0, n_portafolios, tamano_lote):
+        fin = min(inicio + tamano_lote, n_portafolios)
+        W = pesos_aleatorios(fin - inicio, len(mu), metodo, rng)
+        r = W @ mu
+        s = np.sqrt(np.einsum('ij,ij->i', producto_sigma(Sigma, W), W))
+        rand_returns[inicio:fin] = r
+        rand_risks[inicio:fin] = s
+        i = np.argmax(r / s)
+        if r[i] / s[i] > mejor_sharpe:
+            mejor_sharpe, mejores_pesos = r[i] / s[i], W[i].copy()
+    return rand_returns, rand_risks, rand_returns / rand_risks, mejores_pesos
+
+
+def benchmark_nube(mu, Sigma, tamanos=(10_000, 100_000), semilla=42):
+    """Tiempo del bucle por portafolio contra la versión matricial por lotes."""
+    filas = []
+    for n in tamanos:
+        inicio = perf_counter()
+        nube_bucle(n, mu, Sigma, semilla)
+        t_bucle = perf_counter() - inicio
+        inicio = perf_counter()
+        nube_portafolios(n, mu, Sigma, 'uniforme', TAMANO_LOTE_NUBE, semilla)
+        t_matricial = perf_counter() - inicio
+        filas.append({'Portafolios': n, 'Bucle_s': t_bucle, 'Matricial_s': t_matricial,
+                      'Aceleracion': t_bucle / t_matricial})
+    df_benchmark = pd.DataFrame(filas)
+    print("\n===== BENCHMARK NUBE DE PORTAFOLIOS =====")
+    print(df_benchmark.to_string(index=False))
+    return df_benchmark
 
 
 # =====================================
-# 8. EXPORTAR A EXCEL
+# 4. OPTIMIZACIÓN EN PARALELO
 # =====================================
 
-df_tipos = pd.DataFrame({
-    'Apuesta': nombres_apuestas,
-    'Cuota': odds,
-    'RentabilidadEstimada': mu,
-    'Peso_Conservador': w_cons,
-    'Monto_Conservador': montos_cons,
-    'Peso_Moderado': w_mod,
-    'Monto_Moderado': montos_mod,
-    'Peso_Agresivo': w_agr,
-    'Monto_Agresivo': montos_agr
-})
-
-df_resumen_tipos = pd.DataFrame({
-    'Tipo': ['Conservador', 'Moderado_Sharpe', 'Agresivo'],
-    'Rendimiento': [ret_cons, ret_mod, ret_agr],
-    'Riesgo': [risk_cons, risk_mod, risk_agr],
-    'Sharpe': [ret_cons/risk_cons, ret_mod/risk_mod, ret_agr/risk_agr],
-    'MONTO': [MONTO, MONTO, MONTO]
-})
-
-with pd.ExcelWriter(archivo_salida, engine='openpyxl') as writer:
-    df_tipos.to_excel(writer, index=False, sheet_name='Portafolios_Tipos')
-    df_resumen_tipos.to_excel(writer, index=False, sheet_name='Resumen_Tipos')
-
-print(f"\nArchivo Excel exportado en:\n{archivo_salida}")
+# mu y Sigma (o los arreglos de una covarianza factorial) se publican una sola vez en memoria
+# compartida: cada proceso los ve como arreglos de solo lectura y las tareas solo llevan los
+# objetivos de retorno de su tramo.
+_compartidos = {}
+_bloques_abiertos = []
+
+
+def _publicar(arreglos):
+    """Copia cada arreglo a un bloque de memoria compartida; devuelve los bloques y cómo abrirlos."""
+    bloques, descripcion = [], {}
+    for nombre, arreglo in arreglos.items():
+        arreglo = np.ascontiguousarray(arreglo)
+        shm = shared_memory.SharedMemory(create=True, size=max(arreglo.nbytes, 1))
+        np.ndarray(arreglo.shape, dtype=arreglo.dtype, buffer=shm.buf)[...] = arreglo
+        bloques.append(shm)
+        descripcion[nombre] = (shm.name, arreglo.shape, arreglo.dtype.str)
+    return bloques, descripcion
+
+
+def _iniciar_proceso(descripcion):
+    """Inicializador de cada proceso: abre los bloques compartidos sin copiarlos."""
+    for nombre, (nombre_shm, forma, tipo) in descripcion.items():
+        shm = shared_memory.SharedMemory(name=nombre_shm)
+        arreglo = np.ndarray(forma, dtype=tipo, buffer=shm.buf)
+        arreglo.flags.writeable = False
+        _compartidos[nombre] = arreglo
+        _bloques_abiertos.append(shm)
+    if 'Sigma' not in _compartidos:
+        # Covarianza factorial: se rearma sobre los mismos bloques, sin copiar
+        partes = {nombre[6:]: arreglo for nombre, arreglo in _compartidos.items()
+                  if nombre.startswith('Sigma_')}
+        _compartidos['Sigma'] = CovarianzaFactorial.desde_componentes(partes)
+
+
+def _resolver_tarea(tarea):
+    tipo, objetivos = tarea
+    mu, Sigma = _compartidos['mu'], _compartidos['Sigma']
+    if tipo == 'frontera':
+        return frontera_eficiente(objetivos, mu, Sigma)
+    if tipo == 'min_var':
+        return portafolio_min_var(mu, Sigma)
+    return portafolio_max_return(mu, Sigma)
+
+
+def optimizar_en_paralelo(target_returns, mu, Sigma, n_procesos):
+    """
+    Frontera, portafolio de mínima varianza y de máximo rendimiento repartidos en `n_procesos`.
+    Los objetivos se parten en tramos contiguos (dentro de cada tramo se mantiene el arranque
+    en caliente) y pool.map devuelve los resultados en el orden de las tareas, así que la
+    frontera queda en el orden de los objetivos sin importar qué proceso termine primero.
+    Devuelve (rendimientos, riesgos, pesos de la frontera, res_min_var, res_max_return).
+    """
+    tramos = [t for t in np.array_split(np.asarray(target_returns), n_procesos) if len(t)]
+    tareas = [('min_var', None), ('max_return', None)] + [('frontera', t) for t in tramos]
+
+    if isinstance(Sigma, CovarianzaFactorial):
+        arreglos = {f'Sigma_{nombre}': arreglo for nombre, arreglo in Sigma.componentes().items()}
+    else:
+        arreglos = {'Sigma': Sigma}
+    bloques, descripcion = _publicar({'mu': mu, **arreglos})
+    try:
+        with ProcessPoolExecutor(max_workers=n_procesos, initializer=_iniciar_proceso,
+                                 initargs=(descripcion,)) as pool:
+            res_min_var, res_max_return, *fronteras = pool.map(_resolver_tarea, tareas)
+    finally:
+        for shm in bloques:
+            shm.close()
+            shm.unlink()
+
+    pesos = [f[2] for f in fronteras if len(f[2])]
+    frontier_returns = np.concatenate([f[0] for f in fronteras])
+    frontier_risks = np.concatenate([f[1] for f in fronteras])
+    frontier_weights = np.vstack(pesos) if pesos else np.empty((0, len(mu)))
+    return frontier_returns, frontier_risks, frontier_weights, res_min_var, res_max_return
 
 
 # =====================================
-# 9. GRÁFICA PNG (NUBE + TIPOS)
+# 5. RE-OPTIMIZACIÓN CUANDO CAMBIAN LAS CUOTAS
 # =====================================
 
-plt.figure(figsize=(8, 6))
-
-# Nube de portafolios aleatorios
-sc = plt.scatter(rand_risks, rand_returns, c=rand_sharpes,
-                 cmap='viridis', alpha=0.8, label='Portafolios aleatorios')
-
-# Tres portafolios tipo (estrellas)
-plt.scatter(risk_cons, ret_cons, marker='*', s=200, label='Conservador')
-plt.scatter(risk_mod, ret_mod, marker='*', s=200, label='Moderado')
-plt.scatter(risk_agr, ret_agr, marker='*', s=200, label='Agresivo')
-
-plt.xlabel('Volatilidad')
-plt.ylabel('Rendimiento esperado (%)')
-plt.title('Frontera Eficiente de las Apuestas')
-plt.grid(True)
-plt.colorbar(sc, label='Ratio de Sharpe')
-plt.legend()
-
-plt.savefig(archivo_png, dpi=300, bbox_inches='tight')
-plt.close()
+class OptimizadorIncremental:
+    """
+    Conserva mu, Sigma (diagonal o factorial por evento/liga) y las últimas soluciones para
+    que un cambio en algunas cuotas no obligue a empezar de cero: actualizar_cuotas() corrige
+    en su lugar solo las apuestas que cambiaron y vuelve a resolver la frontera y los tres
+    portafolios tipo arrancando desde la solución anterior (cada objetivo, desde su propio punto).
+    """
+
+    def __init__(self, odds, nombres=None, n_frontera=N_FRONTERA, eventos=None, ligas=None,
+                 rho_evento=0.0, rho_liga=0.0):
+        self.odds = np.array(odds, dtype=float)
+        self.mu = self.odds - 1
+        self.Sigma = covarianza_apuestas(self.mu, eventos, ligas, rho_evento, rho_liga)
+        self.indices = {nombre: i for i, nombre in enumerate(nombres)} if nombres is not None else {}
+        self.n_frontera = n_frontera
+        self.resultados = None
+        self.resolver()
+
+    def resolver(self):
+        """Frontera y portafolios conservador, moderado (máximo Sharpe) y agresivo."""
+        min_ret, max_ret = float(self.mu.min()), float(self.mu.max())
+        if np.isclose(min_ret, max_ret):
+            raise ValueError("Todas las rentabilidades son iguales. "
+                             "No se puede construir una frontera eficiente.")
+        target_returns = np.linspace(min_ret, max_ret, self.n_frontera)
+
+        previos = self.resultados or {}
+        frontier_returns, frontier_risks, frontier_weights = frontera_eficiente(
+            target_returns, self.mu, self.Sigma, previos.get('frontier_weights'))
+        if len(frontier_returns) == 0:
+            raise RuntimeError("No se pudo trazar la frontera eficiente.")
+        idx_best = np.argmax(frontier_returns / frontier_risks)
+
+        self.resultados = {
+            'frontier_returns': frontier_returns,
+            'frontier_risks': frontier_risks,
+            'frontier_weights': frontier_weights,
+            'w_cons': portafolio_min_var(self.mu, self.Sigma, previos.get('w_cons')).x,
+            'w_mod': frontier_weights[idx_best],
+            'w_agr': portafolio_max_return(self.mu, self.Sigma).x,
+        }
+        return self.resultados
+
+    def actualizar_cuotas(self, cambios):
+        """
+        `cambios`: {apuesta: nueva cuota}, con la apuesta por su descripción o su posición.
+        Devuelve los resultados re-optimizados.
+        """
+        idx = np.array([self.indices[a] if isinstance(a, str) else int(a) for a in cambios])
+        nuevas = np.array(list(cambios.values()), dtype=float)
+        varianzas_antes = varianzas_apuestas(self.mu[idx])
+        self.odds[idx] = nuevas
+        self.mu[idx] = nuevas - 1
+        if isinstance(self.Sigma, CovarianzaFactorial):
+            self.Sigma.reescalar(idx, np.sqrt(varianzas_apuestas(self.mu[idx]) / varianzas_antes))
+        else:
+            self.Sigma[idx] = varianzas_apuestas(self.mu[idx])
+        return self.resolver()
+
+
+# Protección necesaria para los procesos hijos (en Windows re-importan este script)
+if __name__ == '__main__':
+
+    # =====================================
+    # 6. LECTURA DEL EXCEL
+    # =====================================
+
+    df = leer_excel(archivo_entrada)
+
+    if 'Descripcion' not in df.columns or 'Cuota' not in df.columns:
+        raise ValueError("El Excel debe tener columnas: 'Descripcion' y 'Cuota'.")
+
+    nombres_apuestas = df['Descripcion'].astype(str)
+    odds = df['Cuota'].astype(float).to_numpy()
+
+    # Rentabilidad = Cuota - 1  (único escenario: si se acierta)
+    mu = odds - 1  # (n_apuestas,)
+
+    n_assets = len(mu)
+    if n_assets < 2:
+        raise ValueError("Se requieren al menos 2 apuestas para formar un portafolio.")
+
+    # Matriz de riesgo artificial para poder construir portafolios: diagonal, o con un factor
+    # común por partido y por liga si el Excel trae las columnas 'Evento' y/o 'Liga'
+    eventos, ligas = df.get('Evento'), df.get('Liga')
+    Sigma = covarianza_apuestas(mu, eventos, ligas, CORRELACION_EVENTO, CORRELACION_LIGA)
+
+    # =====================================
+    # 7. PORTAFOLIOS ALEATORIOS (NUBE)
+    # =====================================
+
+    rng_nube = np.random.default_rng(SEMILLA)
+
+    if EJECUTAR_BENCHMARK:
+        benchmark_nube(mu, Sigma)
+
+    rand_returns, rand_risks, rand_sharpes, w_mejor_nube = nube_portafolios(
+        N_RANDOM, mu, Sigma, METODO_NUBE, TAMANO_LOTE_NUBE, rng_nube)
+    print(f"Nube: {N_RANDOM} portafolios, mejor Sharpe {rand_sharpes.max():.3f} "
+          f"(peso máximo {w_mejor_nube.max():.3f} en '{nombres_apuestas.iloc[w_mejor_nube.argmax()]}')")
+
+
+    # =====================================
+    # 8. FRONTERA EFICIENTE (LÍNEA)
+    # =====================================
+
+    min_ret = float(mu.min())
+    max_ret = float(mu.max())
+
+    if np.isclose(min_ret, max_ret):
+        raise ValueError("Todas las rentabilidades son iguales. "
+                         "No se puede construir una frontera eficiente.")
+
+    target_returns = np.linspace(min_ret, max_ret, N_FRONTERA)
+
+    if EJECUTAR_BENCHMARK:
+        benchmark_frontera(target_returns, mu, Sigma)
+
+    if N_PROCESOS > 1:
+        (frontier_returns, frontier_risks, frontier_weights,
+         res_cons, res_agr) = optimizar_en_paralelo(target_returns, mu, Sigma, N_PROCESOS)
+    else:
+        frontier_returns, frontier_risks, frontier_weights = frontera_eficiente(target_returns, mu, Sigma)
+        res_cons = portafolio_min_var(mu, Sigma)
+        res_agr = portafolio_max_return(mu, Sigma)
+
+    if len(frontier_returns) == 0:
+        raise RuntimeError("No se pudo trazar la frontera eficiente.")
+
+
+    # =====================================
+    # 9. TRES TIPOS DE INVERSIONISTA
+    # =====================================
+
+    # 9.1 Conservador: mínima varianza
+    w_cons = res_cons.x
+    ret_cons, risk_cons = portafolio_stats(w_cons, mu, Sigma)
+    montos_cons = w_cons * MONTO
+
+    # 9.2 Moderado: máximo Sharpe sobre la frontera
+    sharpe_frontier = frontier_returns / frontier_risks
+    idx_best = np.argmax(sharpe_frontier)
+    w_mod = frontier_weights[idx_best]
+    ret_mod = frontier_returns[idx_best]
+    risk_mod = frontier_risks[idx_best]
+    montos_mod = w_mod * MONTO
+
+    # 9.3 Agresivo: máximo rendimiento esperado
+    w_agr = res_agr.x
+    ret_agr, risk_agr = portafolio_stats(w_agr, mu, Sigma)
+    montos_agr = w_agr * MONTO
+
+
+    # =====================================
+    # 10. PRINT DE RESULTADOS
+    # =====================================
 
-print(f"Imagen PNG guardada en:\n{archivo_png}")
+    def imprimir_portafolio(nombre_tipo, w, montos, ret, risk):
+        print(f"\n===== PORTAFOLIO {nombre_tipo} =====")
+        for n, wi, mi in zip(nombres_apuestas, w, montos):
+            print(f"Apuesta: {n:25s}  Peso: {wi:6.3f}  Monto: {mi:8.2f}")
+        print(f"Rendimiento esperado: {ret*100:6.2f}%")
+        ganancia = MONTO * ret
+        print(f"Ganancia esperada: {ganancia:.2f}")
+
+    imprimir_portafolio("CONSERVADOR", w_cons, montos_cons, ret_cons, risk_cons)
+    imprimir_portafolio("MODERADO", w_mod, montos_mod, ret_mod, risk_mod)
+    imprimir_portafolio("AGRESIVO", w_agr, montos_agr, ret_agr, risk_agr)
+
+    print(f"\nMONTO total utilizado: {MONTO:.2f}")
+
+
+    # =====================================
+    # 11. EXPORTAR A EXCEL
+    # =====================================
+
+    df_tipos = pd.DataFrame({
+        'Apuesta': nombres_apuestas,
+        'Cuota': odds,
+        'RentabilidadEstimada': mu,
+        'Peso_Conservador': w_cons,
+        'Monto_Conservador': montos_cons,
+        'Peso_Moderado': w_mod,
+        'Monto_Moderado': montos_mod,
+        'Peso_Agresivo': w_agr,
+        'Monto_Agresivo': montos_agr
+    })
+
+    df_resumen_tipos = pd.DataFrame({
+        'Tipo': ['Conservador', 'Moderado_Sharpe', 'Agresivo'],
+        'Rendimiento': [ret_cons, ret_mod, ret_agr],
+        'Riesgo': [risk_cons, risk_mod, risk_agr],
+        'Sharpe': [ret_cons/risk_cons, ret_mod/risk_mod, ret_agr/risk_agr],
+        'MONTO': [MONTO, MONTO, MONTO]
+    })
+
+    with pd.ExcelWriter(archivo_salida, engine='openpyxl') as writer:
+        df_tipos.to_excel(writer, index=False, sheet_name='Portafolios_Tipos')
+        df_resumen_tipos.to_excel(writer, index=False, sheet_name='Resumen_Tipos')
+
+    print(f"\nArchivo Excel exportado en:\n{archivo_salida}")
+
+
+    # =====================================
+    # 12. GRÁFICA PNG (NUBE + TIPOS)
+    # =====================================
+
+    plt.figure(figsize=(8, 6))
+
+    # Nube de portafolios aleatorios (una muestra si son demasiados para dibujarlos todos)
+    if N_RANDOM > MAX_PUNTOS_GRAFICO:
+        muestra = rng_nube.choice(N_RANDOM, MAX_PUNTOS_GRAFICO, replace=False)
+    else:
+        muestra = slice(None)
+    sc = plt.scatter(rand_risks[muestra], rand_returns[muestra], c=rand_sharpes[muestra],
+                     cmap='viridis', alpha=0.8, label='Portafolios aleatorios')
+
+    # Tres portafolios tipo (estrellas)
+    plt.scatter(risk_cons, ret_cons, marker='*', s=200, label='Conservador')
+    plt.scatter(risk_mod, ret_mod, marker='*', s=200, label='Moderado')
+    plt.scatter(risk_agr, ret_agr, marker='*', s=200, label='Agresivo')
+
+    plt.xlabel('Volatilidad')
+    plt.ylabel('Rendimiento esperado (%)')
+    plt.title('Frontera Eficiente de las Apuestas')
+    plt.grid(True)
+    plt.colorbar(sc, label='Ratio de Sharpe')
+    plt.legend()
+
+    plt.savefig(archivo_png, dpi=300, bbox_inches='tight')
+    plt.close()
+
+    print(f"Imagen PNG guardada en:\n{archivo_png}")
+
+
+    # =====================================
+    # 13. ACTUALIZACIÓN DE CUOTAS (EN CALIENTE)
+    # =====================================
+
+    if CAMBIOS_CUOTAS:
+        optimizador = OptimizadorIncremental(odds, nombres_apuestas, N_FRONTERA, eventos, ligas,
+                                             CORRELACION_EVENTO, CORRELACION_LIGA)
+        inicio = perf_counter()
+        nuevos = optimizador.actualizar_cuotas(CAMBIOS_CUOTAS)
+        print(f"\nCuotas actualizadas ({len(CAMBIOS_CUOTAS)}) y portafolios re-optimizados en "
+              f"{perf_counter() - inicio:.3f} s")
+        for tipo, clave in (('CONSERVADOR', 'w_cons'), ('MODERADO', 'w_mod'), ('AGRESIVO', 'w_agr')):
+            w = nuevos[clave]
+            ret, risk = portafolio_stats(w, optimizador.mu, optimizador.Sigma)
+            imprimir_portafolio(f"{tipo} (CUOTAS ACTUALIZADAS)", w, w * MONTO, ret, risk)
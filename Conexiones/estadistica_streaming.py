@@ -0,0 +1,291 @@
+import numpy as np
+
+# Acumuladores en una sola pasada y que se pueden unir (combinar) entre bloques,
+# trozos de archivo o procesos: momentos exactos y bocetos de cuantiles.
+# Los usan la simulación de Montecarlo y la estadística descriptiva de archivos grandes.
+
+
+class EstadisticasOnline:
+    """
+    Media, varianza, asimetría y curtosis acumuladas bloque a bloque
+    (fórmulas de Chan/Pébay) para varias columnas a la vez, sin guardar los datos.
+    """
+
+    def __init__(self, n_variables):
+        self.n = 0
+        self.media = np.zeros(n_variables)
+        self.m2 = np.zeros(n_variables)
+        self.m3 = np.zeros(n_variables)
+        self.m4 = np.zeros(n_variables)
+        self.minimo = np.full(n_variables, np.inf)
+        self.maximo = np.full(n_variables, -np.inf)
+
+    def actualizar(self, bloque):
+        """Agrega un bloque de forma (n_filas, n_variables)."""
+        bloque = np.asarray(bloque, dtype=float)
+        if len(bloque) == 0:
+            return
+        parcial = EstadisticasOnline(bloque.shape[1])
+        parcial.n = len(bloque)
+        parcial.media = bloque.mean(axis=0)
+        desvio = bloque - parcial.media
+        desvio2 = desvio * desvio
+        parcial.m2 = desvio2.sum(axis=0)
+        parcial.m3 = (desvio2 * desvio).sum(axis=0)
+        parcial.m4 = (desvio2 * desvio2).sum(axis=0)
+        parcial.minimo = bloque.min(axis=0)
+        parcial.maximo = bloque.max(axis=0)
+        self.combinar(parcial)
+
+    def combinar(self, otro):
+        """Une las estadísticas de otro acumulador (por ejemplo, de otro bloque o proceso)."""
+        if otro.n == 0:
+            return
+        if self.n == 0:
+            self.n, self.media, self.m2, self.m3, self.m4 = otro.n, otro.media.copy(), otro.m2.copy(), otro.m3.copy(), otro.m4.copy()
+            self.minimo, self.maximo = otro.minimo.copy(), otro.maximo.copy()
+            return
+        na, nb = self.n, otro.n
+        n = na + nb
+        delta = otro.media - self.media
+        m2 = self.m2 + otro.m2 + delta**2 * na * nb / n
+        m3 = (self.m3 + otro.m3 + delta**3 * na * nb * (na - nb) / n**2
+              + 3 * delta * (na * otro.m2 - nb * self.m2) / n)
+        m4 = (self.m4 + otro.m4 + delta**4 * na * nb * (na**2 - na * nb + nb**2) / n**3
+              + 6 * delta**2 * (na**2 * otro.m2 + nb**2 * self.m2) / n**2
+              + 4 * delta * (na * otro.m3 - nb * self.m3) / n)
+        self.media = self.media + delta * nb / n
+        self.m2, self.m3, self.m4 = m2, m3, m4
+        self.n = n
+        self.minimo = np.minimum(self.minimo, otro.minimo)
+        self.maximo = np.maximum(self.maximo, otro.maximo)
+
+    @property
+    def varianza(self):
+        return self.m2 / (self.n - 1)
+
+    @property
+    def desviacion(self):
+        return np.sqrt(self.varianza)
+
+    @property
+    def asimetria(self):
+        # Igual que scipy.stats.skew (sesgada)
+        return np.sqrt(self.n) * self.m3 / self.m2**1.5
+
+    @property
+    def curtosis(self):
+        # Curtosis en exceso, igual que scipy.stats.kurtosis
+        return self.n * self.m4 / self.m2**2 - 3
+
+
+class HistogramaStreaming:
+    """
+    Boceto de cuantiles: histograma fino de ancho fijo que duplica su rango
+    (uniendo celdas de a pares) cuando llegan valores fuera de él. Usa memoria
+    constante y su error es a lo sumo el ancho de una celda.
+    """
+
+    def __init__(self, n_celdas=2**16, rango=None):
+        self.n_celdas = n_celdas
+        self.conteos = np.zeros(n_celdas)
+        self.inicio = None
+        self.ancho = None
+        self.minimo = np.inf
+        self.maximo = -np.inf
+        if rango is not None:
+            # Una rejilla común permite unir bocetos de distintos procesos celda a celda
+            self.inicio = rango[0]
+            self.ancho = (rango[1] - rango[0]) / n_celdas
+
+    @property
+    def total(self):
+        return self.conteos.sum()
+
+    def _duplicar(self, hacia_izquierda):
+        pares = self.conteos.reshape(-1, 2).sum(axis=1)
+        self.conteos = np.zeros(self.n_celdas)
+        if hacia_izquierda:
+            self.conteos[self.n_celdas // 2:] = pares
+            self.inicio -= self.n_celdas * self.ancho
+        else:
+            self.conteos[:self.n_celdas // 2] = pares
+        self.ancho *= 2
+
+    def _cubrir(self, vmin, vmax):
+        if self.inicio is None:
+            margen = max(vmax - vmin, abs(vmax), 1e-12) * 0.05
+            self.inicio = vmin - margen
+            self.ancho = (vmax - vmin + 2 * margen) / self.n_celdas
+        while vmin < self.inicio:
+            self._duplicar(hacia_izquierda=True)
+        while vmax >= self.inicio + self.n_celdas * self.ancho:
+            self._duplicar(hacia_izquierda=False)
+
+    def agregar(self, valores, pesos=None):
+        valores = np.asarray(valores, dtype=float)
+        if valores.size == 0:
+            return
+        vmin, vmax = valores.min(), valores.max()
+        self._cubrir(vmin, vmax)
+        idx = ((valores - self.inicio) / self.ancho).astype(np.int64)
+        np.clip(idx, 0, self.n_celdas - 1, out=idx)
+        self.conteos += np.bincount(idx, weights=pesos, minlength=self.n_celdas)
+        self.minimo = min(self.minimo, vmin)
+        self.maximo = max(self.maximo, vmax)
+
+    def combinar(self, otro):
+        """Une otro boceto; si las rejillas no coinciden se reubican sus celdas."""
+        if otro.inicio is None:
+            return
+        if self.inicio == otro.inicio and self.ancho == otro.ancho:
+            self.conteos += otro.conteos
+            self.minimo = min(self.minimo, otro.minimo)
+            self.maximo = max(self.maximo, otro.maximo)
+            return
+        ocupadas = otro.conteos > 0
+        centros = otro.inicio + (np.flatnonzero(ocupadas) + 0.5) * otro.ancho
+        centros = np.clip(centros, otro.minimo, otro.maximo)
+        self.agregar(centros, pesos=otro.conteos[ocupadas])
+        self.minimo = min(self.minimo, otro.minimo)
+        self.maximo = max(self.maximo, otro.maximo)
+
+    def _acumulado(self):
+        bordes = self.inicio + np.arange(self.n_celdas + 1) * self.ancho
+        acumulado = np.concatenate(([0.0], np.cumsum(self.conteos)))
+        return bordes, acumulado
+
+    def cuantil(self, q):
+        """Cuantil(es) q en [0, 1], interpolando dentro de la celda."""
+        bordes, acumulado = self._acumulado()
+        objetivo = np.asarray(q, dtype=float) * acumulado[-1]
+        i = np.clip(np.searchsorted(acumulado, objetivo, side='left'), 1, self.n_celdas)
+        en_celda = acumulado[i] - acumulado[i - 1]
+        fraccion = np.divide(objetivo - acumulado[i - 1], en_celda,
+                             out=np.zeros_like(objetivo), where=en_celda > 0)
+        return np.clip(bordes[i - 1] + fraccion * self.ancho, self.minimo, self.maximo)
+
+    def percentil(self, p):
+        return self.cuantil(np.asarray(p, dtype=float) / 100)
+
+    def histograma(self, bins=50):
+        """Conteos y bordes de un histograma de `bins` barras entre el mínimo y el máximo."""
+        bordes_finos, acumulado = self._acumulado()
+        bordes = np.linspace(self.minimo, self.maximo, bins + 1)
+        acumulado_bordes = np.interp(bordes, bordes_finos, acumulado)
+        # El mínimo y el máximo caen dentro de una celda fina: se fijan los extremos exactos
+        acumulado_bordes[0], acumulado_bordes[-1] = 0.0, acumulado[-1]
+        conteos = np.diff(acumulado_bordes)
+        return conteos, bordes
+
+
+class BocetoKLL:
+    """
+    Boceto de cuantiles KLL (Karnin, Lang y Liberty): guarda una muestra ponderada
+    de los datos en niveles de compactación, donde cada elemento del nivel h
+    representa 2^h valores. El error en el rango de cualquier cuantil es del orden
+    de 1/k del total, sin importar la escala ni las colas de los datos, y dos
+    bocetos se unen nivel a nivel. La memoria es del orden de 3·k elementos.
+    """
+
+    def __init__(self, k=2000, semilla=0):
+        self.k = k
+        self.niveles = [np.empty(0)]
+        self.n = 0
+        self.minimo = np.inf
+        self.maximo = -np.inf
+        self._rng = np.random.default_rng(semilla)
+
+    @property
+    def total(self):
+        return self.n
+
+    def _capacidad(self, h):
+        # Los niveles bajos (elementos livianos) son más chicos: factor 2/3 por nivel
+        return max(2, int(np.ceil(self.k * (2 / 3) ** (len(self.niveles) - 1 - h))))
+
+    def _compactar(self):
+        h = 0
+        while h < len(self.niveles):
+            nivel = self.niveles[h]
+            if len(nivel) <= self._capacidad(h):
+                h += 1
+                continue
+            if h + 1 == len(self.niveles):
+                self.niveles.append(np.empty(0))
+            nivel = np.sort(nivel)
+            # Con cantidad impar el último queda en el nivel; de los pares sobrevive
+            # uno de cada dos (posición par o impar al azar) con el doble de peso
+            resto = nivel[len(nivel) - len(nivel) % 2:]
+            elegidos = nivel[self._rng.integers(2):len(nivel) - len(nivel) % 2:2]
+            self.niveles[h] = resto
+            self.niveles[h + 1] = np.concatenate([self.niveles[h + 1], elegidos])
+            # Al crecer la cantidad de niveles cambian las capacidades: se revisa desde abajo
+            h = 0
+
+    def agregar(self, valores):
+        valores = np.asarray(valores, dtype=float).ravel()
+        if valores.size == 0:
+            return
+        self.n += valores.size
+        self.minimo = min(self.minimo, valores.min())
+        self.maximo = max(self.maximo, valores.max())
+        self.niveles[0] = np.concatenate([self.niveles[0], valores])
+        self._compactar()
+
+    def combinar(self, otro):
+        """Une otro boceto (por ejemplo, de otro archivo o proceso)."""
+        if otro.n == 0:
+            return
+        while len(self.niveles) < len(otro.niveles):
+            self.niveles.append(np.empty(0))
+        for h, nivel in enumerate(otro.niveles):
+            self.niveles[h] = np.concatenate([self.niveles[h], nivel])
+        self.n += otro.n
+        self.minimo = min(self.minimo, otro.minimo)
+        self.maximo = max(self.maximo, otro.maximo)
+        self._compactar()
+
+    def _acumulado(self):
+        """Valores retenidos ordenados y su rango (peso acumulado al centro de cada uno),
+        con el mínimo y el máximo exactos en los extremos."""
+        valores = np.concatenate(self.niveles)
+        pesos = np.concatenate([np.full(len(nivel), 2.0**h) for h, nivel in enumerate(self.niveles)])
+        orden = np.argsort(valores, kind='stable')
+        valores, pesos = valores[orden], pesos[orden]
+        rangos = np.cumsum(pesos) - pesos / 2
+        # Los pesos retenidos suman n solo aproximadamente: se reescalan al total
+        rangos *= self.n / pesos.sum()
+        return np.r_[self.minimo, valores, self.maximo], np.r_[0.0, rangos, self.n]
+
+    def cuantil(self, q):
+        """Cuantil(es) q en [0, 1], interpolando entre valores retenidos."""
+        valores, rangos = self._acumulado()
+        return np.interp(np.asarray(q, dtype=float) * self.n, rangos, valores)
+
+    def percentil(self, p):
+        return self.cuantil(np.asarray(p, dtype=float) / 100)
+
+    def rango(self, x):
+        """Fracción aproximada de los datos menores o iguales a x."""
+        valores, rangos = self._acumulado()
+        return np.interp(x, valores, rangos) / self.n
+
+    def valores_retenidos(self):
+        """Valores (reales, tomados de los datos) que conserva el boceto, ordenados."""
+        return np.sort(np.concatenate(self.niveles))
+
+    def histograma(self, bins=50):
+        """Conteos aproximados y bordes de un histograma de `bins` barras entre el mínimo y el máximo."""
+        bordes = np.linspace(self.minimo, self.maximo, bins + 1)
+        valores, rangos = self._acumulado()
+        acumulado_bordes = np.interp(bordes, valores, rangos)
+        acumulado_bordes[0], acumulado_bordes[-1] = 0.0, self.n
+        return np.diff(acumulado_bordes), bordes
+
+    def moda(self, ancho_rango=0.01):
+        """Centro del intervalo más corto que contiene una fracción `ancho_rango` de los datos."""
+        q = np.linspace(0, 1, int(round(1 / ancho_rango)) + 1)
+        cuantiles = self.cuantil(q)
+        i = np.argmin(np.diff(cuantiles))
+        return (cuantiles[i] + cuantiles[i + 1]) / 2
@@ -0,0 +1,137 @@
+import os
+import json
+import hashlib
+import pandas as pd
+from openpyxl import load_workbook
+
+# Lectura de los Excel de Flujo/input con caché columnar.
+# La primera lectura de cada archivo/hoja pasa por pd.read_excel (lo lento) y se guarda en
+# Flujo/cache como Parquet (o pickle si no hay pyarrow); las siguientes leen la caché mientras
+# el archivo de origen no cambie (mismo tamaño y fecha de modificación, o mismo contenido).
+
+CARPETA_CACHE = os.path.join(os.getcwd(), 'Flujo', 'cache')
+VERSION_CACHE = 2  # cambia si cambia el formato: las cachés de otra versión se vuelven a generar
+
+
+def _parquet_disponible():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _huella_archivo(ruta, tamano_bloque=1 << 20):
+    """Hash del contenido del archivo (solo se calcula si cambió su tamaño o fecha)."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(tamano_bloque), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def _rutas_cache(ruta, hoja, carpeta_cache):
+    """Archivo de datos y de metadatos de la caché para (archivo, hoja)."""
+    clave = hashlib.blake2b(f'{os.path.abspath(ruta)}|{hoja!r}'.encode(), digest_size=8).hexdigest()
+    nombre = f"{os.path.splitext(os.path.basename(ruta))[0]}__{hoja}__{clave}"
+    base = os.path.join(carpeta_cache, nombre)
+    return base, base + '.json'
+
+
+def _guardar(df, base):
+    """
+    Guarda en Parquet si se puede y si al leerlo se obtiene exactamente el mismo DataFrame
+    (tipos y valores); si no, en pickle. Parquet no respeta las columnas mezcladas: p. ej. una
+    columna 'Fecha' con años enteros y algunas fechas vuelve como datetime64 y el año 1930 se
+    convierte en 1970-01-01 00:00:00.001930.
+    """
+    if _parquet_disponible() and all(isinstance(col, str) for col in df.columns):
+        try:
+            df.to_parquet(base + '.parquet.tmp', index=False)
+            leido = pd.read_parquet(base + '.parquet.tmp')
+            if leido.dtypes.equals(df.dtypes) and leido.equals(df):
+                os.replace(base + '.parquet.tmp', base + '.parquet')
+                return 'parquet'
+        except (ValueError, TypeError):
+            # p. ej. una columna con textos y números mezclados
+            pass
+        if os.path.exists(base + '.parquet.tmp'):
+            os.remove(base + '.parquet.tmp')
+    df.to_pickle(base + '.pkl.tmp')
+    os.replace(base + '.pkl.tmp', base + '.pkl')
+    return 'pkl'
+
+
+def _cargar(base, meta, columnas=None):
+    if meta['formato'] == 'parquet':
+        if columnas is not None:
+            faltantes = [col for col in columnas if col not in meta['columnas']]
+            if faltantes:
+                raise KeyError(f"Columnas no encontradas en la hoja '{meta['hoja']}': {faltantes}")
+        return pd.read_parquet(base + '.parquet', columns=columnas)
+    df = pd.read_pickle(base + '.pkl')
+    return df if columnas is None else df[columnas]
+
+
+def leer_excel(ruta, hoja=0, columnas=None, carpeta_cache=None, usar_cache=True):
+    """
+    Equivalente a pd.read_excel(ruta, sheet_name=hoja, engine='openpyxl') con caché.
+    La caché se identifica por la ruta absoluta y la hoja, y se valida contra el tamaño y la
+    fecha de modificación del archivo; si estos cambiaron pero el contenido (hash) es el mismo,
+    se reutiliza igual. Con `columnas` solo se leen esas columnas (en Parquet, sin cargar el resto).
+    """
+    if columnas is not None:
+        columnas = list(columnas)
+    if not usar_cache:
+        df = pd.read_excel(ruta, engine='openpyxl', sheet_name=hoja)
+        return df if columnas is None else df[columnas]
+
+    carpeta_cache = carpeta_cache or CARPETA_CACHE
+    os.makedirs(carpeta_cache, exist_ok=True)
+    base, ruta_meta = _rutas_cache(ruta, hoja, carpeta_cache)
+    info = os.stat(ruta)  # FileNotFoundError si no existe, igual que read_excel
+
+    meta = None
+    if os.path.exists(ruta_meta):
+        with open(ruta_meta, encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != VERSION_CACHE or not os.path.exists(f"{base}.{meta['formato']}"):
+            meta = None
+
+    if meta is not None and (meta['tamano'], meta['mtime_ns']) != (info.st_size, info.st_mtime_ns):
+        # El archivo se tocó: solo se vuelve a leer si su contenido es distinto
+        huella = _huella_archivo(ruta)
+        if huella == meta['huella']:
+            meta.update(tamano=info.st_size, mtime_ns=info.st_mtime_ns)
+            with open(ruta_meta, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, indent=2)
+        else:
+            meta = None
+
+    if meta is None:
+        df = pd.read_excel(ruta, engine='openpyxl', sheet_name=hoja)
+        meta = {
+            'version': VERSION_CACHE,
+            'ruta': os.path.abspath(ruta),
+            'hoja': hoja,
+            'tamano': info.st_size,
+            'mtime_ns': info.st_mtime_ns,
+            'huella': _huella_archivo(ruta),
+            'formato': _guardar(df, base),
+        }
+        # Nombres de columna para validar `columnas` sin abrir el Parquet (siempre son texto)
+        meta['columnas'] = list(df.columns) if meta['formato'] == 'parquet' else None
+        with open(ruta_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+    # Siempre desde la caché, para que la primera lectura y las siguientes den lo mismo
+    return _cargar(base, meta, columnas)
+
+
+def hojas_excel(ruta):
+    """Nombres de las hojas del libro, en orden (sin leer su contenido)."""
+    wb = load_workbook(ruta, read_only=True)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
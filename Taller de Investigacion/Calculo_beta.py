@@ -1,8 +1,16 @@
 import os
+import sys
+import matplotlib
+matplotlib.use('Agg') # Sin ventanas: los gráficos solo se guardan en PNG (también en los procesos hijos)
 import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib.ticker import FuncFormatter
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# Agregar la carpeta padre al path para poder importar módulos desde allí
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Conexiones.lectura_excel import leer_excel
 
 # Obtener el directorio actual donde está el script de Python
 base_dir = os.getcwd()
@@ -18,76 +26,309 @@ os.makedirs(output_dir_plots, exist_ok=True) # Crea el directorio si no existe
 # Nombre del archivo Excel de salida para los resultados
 archivo_salida_excel = os.path.join(base_dir, 'Flujo', 'output', 'pendientes_beta_positivas.xlsx')
 
-# --- CARGA DE DATOS ---
-df_variacion = pd.read_excel(archivo_entrada, engine='openpyxl')
+# --- BETAS MÓVILES ---
+# Ventanas (en periodos) para las betas que varían en el tiempo; lista vacía para omitirlas
+ventanas_beta_movil = [36, 60]
+fraccion_min_observaciones = 0.8  # Beta solo si la ventana tiene al menos esta fracción de pares válidos
+archivo_betas_moviles = os.path.join(base_dir, 'Flujo', 'output', 'betas_moviles.xlsx')
+
+# --- BOOTSTRAP DE LAS BETAS ---
+n_bootstrap = 5000            # Remuestreos (0 para omitir los intervalos)
+metodo_bootstrap = 'bloques'  # 'simple' (filas) o 'bloques' (bloques móviles, respeta autocorrelación)
+longitud_bloque = None        # None = n^(1/3) redondeado
+nivel_confianza = 0.95
+exigir_ic_positivo = False    # True: solo se grafican empresas cuyo IC inferior es > 0 (no solo m > 0)
+semilla_bootstrap = 42
+
+# --- GRÁFICOS ---
+n_procesos_graficos = os.cpu_count() # Procesos que generan los PNG (1 = en serie)
+
+# --- ESTIMACIÓN DE BETAS (TODAS LAS EMPRESAS A LA VEZ) ---
+
+def coeficientes_regresion(n, sx, sxx, sy, syy, sxy):
+    """
+    Pendiente, intercepto, R², error estándar y t a partir de las sumas
+    n, Σx, Σx², Σy, Σy², Σxy (arreglos de cualquier forma, uno por regresión).
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sxx_c = sxx - sx * sx / n          # Σ(x - x̄)²
+        syy_c = syy - sy * sy / n          # Σ(y - ȳ)²
+        sxy_c = sxy - sx * sy / n          # Σ(x - x̄)(y - ȳ)
+        pendiente = sxy_c / sxx_c
+        intercepto = (sy - pendiente * sx) / n
+        r2 = sxy_c * sxy_c / (sxx_c * syy_c)
+        sse = np.maximum(syy_c - pendiente * sxy_c, 0.0)
+        error_estandar = np.sqrt(sse / (n - 2) / sxx_c)
+        t_stat = pendiente / error_estandar
+    return {
+        'Pendiente_Beta': pendiente,
+        'Intercepto': intercepto,
+        'R2': r2,
+        'Error_Estandar': error_estandar,
+        't_stat': t_stat,
+        'Observaciones': np.asarray(n).astype(int),
+    }
+
+
+def estimar_betas(df, mercado='SP500', columnas=None):
+    """
+    Regresión lineal de cada empresa contra el mercado en forma matricial.
+    Cada empresa usa solo las fechas en que ella y el mercado tienen dato
+    (igual que dropna() por pares), pero sin recorrer las columnas en Python.
+    Devuelve una tabla con pendiente (beta), intercepto, R², error estándar,
+    estadístico t y número de observaciones por empresa.
+    """
+    if columnas is None:
+        columnas = [col for col in df.columns if col not in ['Fecha', mercado]]
+    x = df[mercado].to_numpy(dtype=float)
+    Y = df[columnas].to_numpy(dtype=float)
+
+    # Máscara de pares válidos (n_fechas, n_empresas); los NaN pasan a 0 y no suman
+    validos = ~np.isnan(Y) & ~np.isnan(x)[:, None]
+    M = validos.astype(float)
+    x0 = np.where(np.isnan(x), 0.0, x)
+    Y0 = np.where(validos, Y, 0.0)
+
+    # Sumas por empresa con productos matriciales
+    n = M.sum(axis=0)
+    sx = x0 @ M
+    sxx = (x0 * x0) @ M
+    sy = Y0.sum(axis=0)
+    syy = (Y0 * Y0).sum(axis=0)
+    sxy = x0 @ Y0
+
+    resultados = pd.DataFrame({'Empresa': columnas, **coeficientes_regresion(n, sx, sxx, sy, syy, sxy)})
+    # Con menos de 2 observaciones no hay recta (antes: df_temp.empty -> continue)
+    return resultados[resultados['Observaciones'] >= 2].reset_index(drop=True)
+
+
+def indices_bootstrap(n, n_remuestreos, metodo='simple', longitud_bloque=None, rng=None):
+    """
+    Matriz (n_remuestreos, n) de filas remuestreadas.
+    'simple': filas con reemplazo. 'bloques': bloques móviles consecutivos de
+    `longitud_bloque` filas (por defecto n^(1/3)) pegados hasta completar n.
+    """
+    rng = np.random.default_rng(rng)
+    if metodo == 'simple':
+        return rng.integers(0, n, size=(n_remuestreos, n))
+    if metodo == 'bloques':
+        # Con historias cortas el bloque no puede ser más largo que la serie
+        longitud = min(longitud_bloque or max(1, int(round(n ** (1 / 3)))), n)
+        n_bloques = -(-n // longitud)
+        inicios = rng.integers(0, n - longitud + 1, size=(n_remuestreos, n_bloques))
+        return (inicios[:, :, None] + np.arange(longitud)).reshape(n_remuestreos, -1)[:, :n]
+    raise ValueError(f"Método de bootstrap desconocido: '{metodo}'. Use 'simple' o 'bloques'.")
 
-# --- PROCESAMIENTO Y GRÁFICOS ---
 
-# Lista para almacenar los resultados (empresa y su pendiente)
-resultados_pendientes = []
+def bootstrap_betas(df, mercado='SP500', columnas=None, n_remuestreos=5000, metodo='simple',
+                    longitud_bloque=None, nivel_confianza=0.95, semilla=42, remuestreos_por_lote=1000):
+    """
+    Betas bootstrap de todas las empresas a la vez. Cada remuestreo se expresa
+    como un vector de pesos (cuántas veces entra cada fila), así las sumas de la
+    regresión de todos los remuestreos y empresas salen de productos matriciales
+    (remuestreos × filas) @ (filas × empresas), sin bucles anidados.
+    Devuelve por empresa el intervalo de confianza percentil, el error estándar
+    bootstrap y la proporción de remuestreos con beta > 0.
+    """
+    if columnas is None:
+        columnas = [col for col in df.columns if col not in ['Fecha', mercado]]
+    x = df[mercado].to_numpy(dtype=float)
+    Y = df[columnas].to_numpy(dtype=float)
+    n = len(x)
 
-# Definir las variables para el eje Y
-variables_y = [col for col in df_variacion.columns if col not in ['Fecha', 'SP500']]
+    validos = ~np.isnan(Y) & ~np.isnan(x)[:, None]
+    M = validos.astype(float)
+    X0 = np.where(np.isnan(x), 0.0, x)[:, None] * M
+    Y0 = np.where(validos, Y, 0.0)
+    # Columnas de las que se necesitan sumas ponderadas: 1, x, x², y, y², xy (por empresa)
+    terminos = [M, X0, X0 * X0, Y0, Y0 * Y0, X0 * Y0]
+
+    rng = np.random.default_rng(semilla)
+    pendientes = []
+    for inicio in range(0, n_remuestreos, remuestreos_por_lote):
+        b = min(remuestreos_por_lote, n_remuestreos - inicio)
+        indices = indices_bootstrap(n, b, metodo, longitud_bloque, rng)
+        # Pesos (b, n): número de veces que cada fila aparece en cada remuestreo
+        desplazados = indices + n * np.arange(b)[:, None]
+        W = np.bincount(desplazados.ravel(), minlength=b * n).reshape(b, n).astype(float)
+        sumas = [W @ t for t in terminos]
+        pendientes.append(coeficientes_regresion(*sumas)['Pendiente_Beta'])
+    pendientes = np.vstack(pendientes)
+
+    alfa = (1 - nivel_confianza) / 2
+    with np.errstate(invalid='ignore'):
+        ic_inferior, ic_superior = np.nanpercentile(pendientes, [100 * alfa, 100 * (1 - alfa)], axis=0)
+        prob_positiva = np.mean(pendientes > 0, axis=0)
+    return pd.DataFrame({
+        'Empresa': columnas,
+        'IC_Inferior': ic_inferior,
+        'IC_Superior': ic_superior,
+        'Error_Estandar_Bootstrap': np.nanstd(pendientes, axis=0, ddof=1),
+        'Prob_Beta_Positiva': prob_positiva,
+    })
+
+
+def betas_moviles(df, ventana, mercado='SP500', columnas=None, min_observaciones=None,
+                  fraccion_min_observaciones=0.8):
+    """
+    Beta de cada empresa en una ventana móvil de `ventana` periodos.
+    Las sumas Σx, Σx², Σy, Σy², Σxy y el conteo de pares válidos se actualizan
+    al deslizar la ventana (suma acumulada menos la de hace `ventana` periodos),
+    así cada empresa cuesta O(n) sin importar el tamaño de la ventana.
+    Las fechas con dato faltante se excluyen con la máscara de pares válidos.
+    Devuelve un panel (fechas × empresas) con NaN donde hay menos de
+    `min_observaciones` pares (por defecto, `fraccion_min_observaciones` de la ventana,
+    así un dato faltante no anula la ventana completa).
+    """
+    if columnas is None:
+        columnas = [col for col in df.columns if col not in ['Fecha', mercado]]
+    if min_observaciones is None:
+        min_observaciones = int(fraccion_min_observaciones * ventana)
+    x = df[mercado].to_numpy(dtype=float)
+    Y = df[columnas].to_numpy(dtype=float)
+
+    validos = ~np.isnan(Y) & ~np.isnan(x)[:, None]
+    M = validos.astype(float)
+    # Centrar antes de acumular reduce el error de redondeo de las sumas acumuladas
+    x0 = np.where(np.isnan(x), 0.0, x - np.nanmean(x))[:, None] * M
+    Y0 = np.where(validos, Y - np.nanmean(Y, axis=0), 0.0)
+
+    def suma_movil(a):
+        acumulada = np.cumsum(a, axis=0)
+        acumulada[ventana:] = acumulada[ventana:] - acumulada[:-ventana].copy()
+        return acumulada
+
+    n = suma_movil(M)
+    coeficientes = coeficientes_regresion(n, suma_movil(x0), suma_movil(x0 * x0),
+                                          suma_movil(Y0), suma_movil(Y0 * Y0), suma_movil(x0 * Y0))
+    betas = np.where(n >= max(min_observaciones, 2), coeficientes['Pendiente_Beta'], np.nan)
+    indice = df['Fecha'] if 'Fecha' in df.columns else df.index
+    return pd.DataFrame(betas, index=pd.Index(indice, name='Fecha'), columns=columnas)
+
+
+# --- GRÁFICOS EN PARALELO ---
 
 # Función para formatear los ejes como porcentaje
 def percent(x, pos):
     return f'{100*x:.1f}%'
 
-# Generar un gráfico por cada variable en Y
-for variable in variables_y:
-    
-    # Crea un DataFrame temporal y elimina las filas con NaN
-    df_temp = df_variacion[['SP500', variable]].dropna()
-
-    if df_temp.empty:
-        continue # Si no hay datos, salta a la siguiente variable
-
-    # Asigna los datos limpios a 'x' e 'y'
-    x = df_temp['SP500']
-    y = df_temp[variable]
-    
-    # Calcula los coeficientes de la línea de tendencia
-    m, b = np.polyfit(x, y, 1)
-
-    # --- NUEVA CONDICIÓN: SOLO PROCESAR SI LA PENDIENTE ES POSITIVA ---
-    if m > 0:
-        print(f"Procesando '{variable}': Pendiente positiva ({m:.4f}). Generando gráfico...")
-
-        # Almacenar el resultado en la lista
-        resultados_pendientes.append({'Empresa': variable, 'Pendiente_Beta': m})
-
-        # --- Creación del Gráfico ---
-        plt.figure(figsize=(8, 6))
-        plt.scatter(x, y, alpha=0.5, c='black')
-        plt.plot(x, m*x + b, color='black', linewidth=1.5, label='Línea de Tendencia')
-
-        # Configuración del gráfico
-        plt.title('Diagrama de Dispersión')
-        plt.xlabel('Rendimiento de S&P500 en %')
-        plt.ylabel(f'Rendimiento de {variable} por acción en %')
-        plt.grid(True)
-        plt.legend()
-        plt.gca().xaxis.set_major_formatter(FuncFormatter(percent))
-        plt.gca().yaxis.set_major_formatter(FuncFormatter(percent))
-        
-        # Guarda la imagen
-        output_image = os.path.join(output_dir_plots, f'beta_{variable}_vs_SP500.png')
-        plt.savefig(output_image)
-        plt.close()
-    else:
-        # Mensaje opcional para saber cuáles se omitieron
-        print(f"Omitiendo '{variable}': Pendiente no positiva ({m:.4f}).")
+
+# Cada proceso arma una sola figura y solo cambia los datos de una empresa a otra
+_plantilla = None
 
 
-# --- EXPORTACIÓN DE RESULTADOS A EXCEL ---
-if resultados_pendientes:
-    # Crear un DataFrame de pandas a partir de la lista de resultados
-    df_resultados = pd.DataFrame(resultados_pendientes)
+def _crear_plantilla():
+    fig, ax = plt.subplots(figsize=(8, 6))
+    puntos = ax.scatter([], [], alpha=0.5, c='black')
+    linea, = ax.plot([], [], color='black', linewidth=1.5, label='Línea de Tendencia')
 
-    # Exportar el DataFrame a un archivo Excel
-    df_resultados.to_excel(archivo_salida_excel, index=False, engine='openpyxl')
-    print(f"\nResultados de pendientes positivas exportados a: {archivo_salida_excel}")
-else:
-    print("\nNo se encontraron variables con pendiente positiva. No se generó el archivo Excel.")
+    # Configuración del gráfico
+    ax.set_title('Diagrama de Dispersión')
+    ax.set_xlabel('Rendimiento de S&P500 en %')
+    ax.grid(True)
+    ax.legend()
+    ax.xaxis.set_major_formatter(FuncFormatter(percent))
+    ax.yaxis.set_major_formatter(FuncFormatter(percent))
+    return fig, ax, puntos, linea
+
+
+def graficar_beta(tarea):
+    """Dibuja y guarda el diagrama de dispersión de una empresa sobre la plantilla del proceso."""
+    global _plantilla
+    variable, x, y, m, b, output_image = tarea
+    if _plantilla is None:
+        _plantilla = _crear_plantilla()
+    fig, ax, puntos, linea = _plantilla
+
+    puntos.set_offsets(np.column_stack([x, y]))
+    linea.set_data(x, m*x + b)
+    ax.set_ylabel(f'Rendimiento de {variable} por acción en %')
+
+    # Reescala los ejes solo con los datos de esta empresa (relim() ignora el scatter)
+    ax.ignore_existing_data_limits = True
+    ax.update_datalim(np.column_stack([x, y]))
+    ax.update_datalim(np.column_stack([x, m*x + b]))
+    ax.autoscale_view()
+
+    fig.savefig(output_image)
+    return output_image
+
+
+def graficar_betas(tareas, n_procesos=1):
+    """Reparte los gráficos entre procesos; cada uno reutiliza su propia plantilla."""
+    if n_procesos > 1 and len(tareas) > 1:
+        with ProcessPoolExecutor(max_workers=n_procesos) as pool:
+            tamano_lote = max(1, len(tareas) // (4 * n_procesos))
+            return list(pool.map(graficar_beta, tareas, chunksize=tamano_lote))
+    return [graficar_beta(tarea) for tarea in tareas]
+
+
+# Protección necesaria para los procesos hijos (en Windows re-importan este script)
+if __name__ == '__main__':
+
+    # --- CARGA DE DATOS ---
+    df_variacion = leer_excel(archivo_entrada)
+
+    df_betas = estimar_betas(df_variacion, mercado='SP500')
+
+    # Intervalos de confianza bootstrap para cada beta
+    if n_bootstrap:
+        df_bootstrap = bootstrap_betas(df_variacion, 'SP500', list(df_betas['Empresa']), n_bootstrap,
+                                       metodo_bootstrap, longitud_bloque, nivel_confianza, semilla_bootstrap)
+        df_betas = df_betas.merge(df_bootstrap, on='Empresa', how='left')
+
+    # --- BETAS MÓVILES (PANEL POR VENTANA) ---
+    if ventanas_beta_movil:
+        with pd.ExcelWriter(archivo_betas_moviles, engine='openpyxl') as writer:
+            for ventana in ventanas_beta_movil:
+                panel = betas_moviles(df_variacion, ventana, mercado='SP500',
+                                      fraccion_min_observaciones=fraccion_min_observaciones)
+                panel.to_excel(writer, sheet_name=f'Beta_{ventana}_periodos')
+        print(f"Betas móviles ({ventanas_beta_movil} periodos) exportadas a: {archivo_betas_moviles}")
+
+    # --- GRÁFICOS ---
+
+    # Lista para almacenar los resultados (empresa y su pendiente)
+    resultados_pendientes = []
+    tareas_graficos = []
+
+    # Un gráfico por cada variable en Y (primero se decide cuáles, luego se dibujan en paralelo)
+    for fila in df_betas.itertuples(index=False):
+        variable = fila.Empresa
+        m, b = fila.Pendiente_Beta, fila.Intercepto
+
+        # --- NUEVA CONDICIÓN: SOLO PROCESAR SI LA PENDIENTE ES POSITIVA ---
+        # (opcionalmente, si todo el intervalo de confianza bootstrap es positivo)
+        es_positiva = fila.IC_Inferior > 0 if (exigir_ic_positivo and n_bootstrap) else m > 0
+        if es_positiva:
+            print(f"Procesando '{variable}': Pendiente positiva ({m:.4f}). Generando gráfico...")
+
+            # Almacenar el resultado en la lista
+            resultados_pendientes.append(fila._asdict())
+
+            # Datos limpios solo para el gráfico
+            df_temp = df_variacion[['SP500', variable]].dropna()
+            output_image = os.path.join(output_dir_plots, f'beta_{variable}_vs_SP500.png')
+            tareas_graficos.append((variable, df_temp['SP500'].to_numpy(), df_temp[variable].to_numpy(),
+                                    m, b, output_image))
+        else:
+            # Mensaje opcional para saber cuáles se omitieron
+            print(f"Omitiendo '{variable}': Pendiente no positiva ({m:.4f}).")
+
+    graficar_betas(tareas_graficos, n_procesos_graficos)
+    print(f"\n{len(tareas_graficos)} gráficos guardados en: {output_dir_plots}")
+
+    # --- EXPORTACIÓN DE RESULTADOS A EXCEL ---
+    if resultados_pendientes:
+        # Crear un DataFrame de pandas a partir de la lista de resultados
+        df_resultados = pd.DataFrame(resultados_pendientes)
+
+        # Exportar a Excel: empresas con pendiente positiva y la tabla completa de la regresión
+        with pd.ExcelWriter(archivo_salida_excel, engine='openpyxl') as writer:
+            df_resultados.to_excel(writer, sheet_name='Pendientes_Positivas', index=False)
+            df_betas.to_excel(writer, sheet_name='Todas_las_Empresas', index=False)
+        print(f"\nResultados de pendientes positivas exportados a: {archivo_salida_excel}")
+    else:
+        print("\nNo se encontraron variables con pendiente positiva. No se generó el archivo Excel.")
 
-print("\nProceso completado.")
\ No newline at end of file
+    print("\nProceso completado.")
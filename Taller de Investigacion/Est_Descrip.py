@@ -1,14 +1,20 @@
 # Análisis de variables con Estadistica Descriptiva
 
 import os
+import sys
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime
-from scipy.stats import kurtosis, skew, norm
+from scipy.stats import norm
 import numpy as np
 from matplotlib.ticker import FuncFormatter # <-- Importante tener esta línea
 
+# Agregar la carpeta padre al path para poder importar módulos desde allí
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Conexiones.lectura_excel import leer_excel, hojas_excel
+from Conexiones.estadistica_streaming import EstadisticasOnline, BocetoKLL
+
 # -------------------------------------------------------------------------------------------------------------------------------
 # RUTA DE LOS ARCHIVOS Y MODIFICACION DE VARIABLES
 # -------------------------------------------------------------------------------------------------------------------------------
@@ -24,120 +30,414 @@ nombre_de_la_hoja = 'Riesgo País' #Hoja del archivo
 variable = 'Riesgo Pais' # Nombre de la variable
 mostrar_histograma_en_porcentaje = True #Histograma en porcentaje
 
+# Modo lote: tabla de estadísticas de TODAS las columnas numéricas de TODAS las hojas
+# del archivo en un solo Excel consolidado (sin gráficos). Ignora la hoja/variable de arriba.
+modo_lote = False
+graficos_lote = True # En modo lote: diagramas de caja e histogramas de todas las variables en grillas
+variables_por_figura = 12 # Paneles por figura de la grilla
+columnas_grilla = 4
+histograma_numpy = True # True: bins con np.histogram y barras directas; False: seaborn
+
+# Archivo grande (CSV o Parquet) para analizar `variable` por trozos, sin cargarlo entero:
+# momentos exactos y cuantiles/bigotes aproximados con un boceto KLL (error de rango del orden de 1/k).
+# None para usar la hoja de Excel de arriba.
+archivo_grande = None # p. ej. os.path.join(base_dir, 'Flujo', 'input', 'ticks.parquet')
+tamano_trozo = 1_000_000 # Filas por trozo
+
+
+# -------------------------------------------------------------------------------------------------------------------------------
+# FUNCIONES
+# -------------------------------------------------------------------------------------------------------------------------------
+
+# Medidas en el orden de la tabla de salida
+MEDIDAS = ['Media', 'Mediana', 'Moda', 'Desviación estándar', 'Varianza', 'Rango',
+           'Coeficiente de variación', 'Asimetría', 'Curtosis', 'Mínimo', '1er Cuartil',
+           'Mediana', '3er Cuartil', 'Máximo']
+
+
+def estadisticas_descriptivas(valores):
+    """
+    Estadísticas de una columna con un solo ordenamiento y una sola pasada de momentos.
+    Del arreglo ordenado salen mínimo, máximo, cuartiles (interpolación lineal, como
+    pandas.quantile) y moda (el valor más pequeño entre los más repetidos, como mode()[0]);
+    de los momentos centrales salen varianza y desviación (ddof=1, como pandas), asimetría
+    y curtosis de Fisher (sesgadas, como scipy.stats.skew/kurtosis). Ignora los NaN.
+    Devuelve un diccionario con las claves de MEDIDAS (más 'Observaciones').
+    """
+    x = np.sort(np.asarray(valores, dtype=float))
+    x = x[:len(x) - np.isnan(x).sum()]  # np.sort deja los NaN al final
+    n = len(x)
+    if n == 0:
+        return {**dict.fromkeys(MEDIDAS, np.nan), 'Observaciones': 0}
+
+    def cuantil(p):
+        h = (n - 1) * p
+        i = int(np.floor(h))
+        return x[i] + (h - i) * (x[min(i + 1, n - 1)] - x[i])
+
+    # Moda: inicio de cada racha de valores iguales y su largo
+    inicios = np.flatnonzero(np.r_[True, x[1:] != x[:-1]])
+    largos = np.diff(np.r_[inicios, n])
+    moda = x[inicios[np.argmax(largos)]]
+
+    # Momentos centrales
+    media = x.mean()
+    d = x - media
+    d2 = d * d
+    m2 = d2.mean()
+    m3 = (d2 * d).mean()
+    m4 = (d2 * d2).mean()
+    varianza = m2 * n / (n - 1) if n > 1 else np.nan
+    desviacion = np.sqrt(varianza)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        asimetria = m3 / m2 ** 1.5
+        curtosis_val = m4 / (m2 * m2) - 3.0
+
+    q1, mediana, q3 = cuantil(0.25), cuantil(0.50), cuantil(0.75)
+    return {
+        'Media': media, 'Mediana': mediana, 'Moda': moda, 'Desviación estándar': desviacion,
+        'Varianza': varianza, 'Rango': x[-1] - x[0], 'Coeficiente de variación': desviacion / media,
+        'Asimetría': asimetria, 'Curtosis': curtosis_val, 'Mínimo': x[0], '1er Cuartil': q1,
+        '3er Cuartil': q3, 'Máximo': x[-1], 'Observaciones': n,
+    }
+
+
+def datos_lote(ruta, hojas=None):
+    """Lista de (hoja, variable, valores sin NaN) para cada columna numérica de cada hoja (todas si `hojas` es None)."""
+    datos = []
+    for hoja in hojas or hojas_excel(ruta):
+        df_hoja = leer_excel(ruta, hoja=hoja)
+        for col in df_hoja.columns:
+            if pd.api.types.is_numeric_dtype(df_hoja[col]) and not pd.api.types.is_bool_dtype(df_hoja[col]):
+                valores = df_hoja[col].to_numpy(dtype=float)
+                datos.append((hoja, col, valores[~np.isnan(valores)]))
+    return datos
+
+
+def estadisticas_lote(datos):
+    """Tabla con una fila por (hoja, variable) de `datos_lote` y una columna por medida."""
+    return pd.DataFrame([{'Hoja': hoja, 'Variable': col, **estadisticas_descriptivas(valores)}
+                         for hoja, col, valores in datos])
+
+
+def graficar_cuadricula(datos, output_dir, por_figura=12, columnas=4, en_porcentaje=True,
+                        usar_numpy=True, plot_color='lightblue'):
+    """
+    Diagramas de caja e histogramas (con la campana de Gauss) de muchas variables como
+    paneles de unas pocas figuras: una figura de cajas y otra de histogramas por cada
+    `por_figura` variables, cada una armada y guardada una sola vez.
+    Con `usar_numpy` los bins salen de np.histogram y se dibujan como barras directas.
+    Devuelve las rutas de las imágenes.
+    """
+    formato_eje = FuncFormatter(lambda v, pos: f'{100 * v:.1f}%' if en_porcentaje else f'{v:g}')
+    rutas = []
+    for numero, inicio in enumerate(range(0, len(datos), por_figura), start=1):
+        grupo = datos[inicio:inicio + por_figura]
+        filas = -(-len(grupo) // columnas)
+        # Márgenes fijos en lugar de tight_layout (que dibuja la figura una vez más solo para medirla)
+        espaciado = {'hspace': 0.4, 'wspace': 0.35, 'left': 0.06, 'right': 0.98, 'top': 0.94, 'bottom': 0.06}
+        fig_cajas, ejes_cajas = plt.subplots(filas, columnas, figsize=(3 * columnas, 3.6 * filas), squeeze=False,
+                                             gridspec_kw=espaciado)
+        fig_hist, ejes_hist = plt.subplots(filas, columnas, figsize=(4 * columnas, 3 * filas), squeeze=False,
+                                           gridspec_kw=espaciado)
+
+        for (hoja, variable, valores), ax_caja, ax_hist in zip(grupo, ejes_cajas.flat, ejes_hist.flat):
+            titulo = f'{hoja}: {variable}'
+            media = valores.mean()
+
+            # Diagrama de caja con la media
+            ax_caja.boxplot(valores, widths=0.5, patch_artist=True, boxprops={'facecolor': plot_color},
+                            medianprops={'color': 'black'})
+            ax_caja.axhline(media, color='blue', linestyle='--', linewidth=1.2)
+            ax_caja.set_title(titulo, fontsize=9)
+            ax_caja.set_xticks([])
+            ax_caja.yaxis.set_major_formatter(formato_eje)
+
+            # Histograma en densidad y campana de Gauss (media y desviación de máxima verosimilitud)
+            if usar_numpy:
+                densidad, bordes = np.histogram(valores, bins=20, density=True)
+                ax_hist.bar(bordes[:-1], densidad, width=np.diff(bordes), align='edge', color=plot_color,
+                            edgecolor='black', alpha=0.75, linewidth=0.5)
+            else:
+                sns.histplot(valores, color=plot_color, bins=20, stat='density', ax=ax_hist)
+            x = np.linspace(*ax_hist.get_xlim(), 100)
+            ax_hist.plot(x, norm.pdf(x, media, valores.std()), 'k', linewidth=1.5)
+            ax_hist.set_title(titulo, fontsize=9)
+            ax_hist.set_ylabel('')
+            ax_hist.xaxis.set_major_formatter(formato_eje)
+
+        # Paneles sobrantes de la última figura
+        for ax in list(ejes_cajas.flat[len(grupo):]) + list(ejes_hist.flat[len(grupo):]):
+            ax.set_visible(False)
+
+        for fig, nombre in [(fig_cajas, 'cajas'), (fig_hist, 'histogramas')]:
+            ruta = os.path.join(output_dir, f'{nombre}_{numero}.png')
+            fig.savefig(ruta)
+            plt.close(fig)
+            rutas.append(ruta)
+    return rutas
+
+
+def leer_por_trozos(ruta, columna, tamano_trozo=1_000_000):
+    """Genera la columna de un CSV o Parquet como arreglos float de a `tamano_trozo` filas."""
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension == '.parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Leer Parquet requiere pyarrow (pip install pyarrow); use un CSV.")
+        for lote in pq.ParquetFile(ruta).iter_batches(batch_size=tamano_trozo, columns=[columna]):
+            yield lote.column(0).to_numpy(zero_copy_only=False).astype(float)
+    elif extension in ('.csv', '.txt'):
+        for trozo in pd.read_csv(ruta, usecols=[columna], chunksize=tamano_trozo):
+            yield trozo[columna].to_numpy(dtype=float)
+    else:
+        raise ValueError(f"Formato no soportado para lectura por trozos: '{extension}'. Use CSV o Parquet.")
+
+
+def estadisticas_streaming(trozos, k=2000):
+    """
+    Recorre los trozos una sola vez: momentos exactos (EstadisticasOnline) y boceto de
+    cuantiles KLL, cuyo error de rango no depende de la escala ni de los atípicos.
+    Ambos se pueden unir con combinar(), así que también sirven para procesar varios
+    archivos por separado.
+    """
+    acumulado = EstadisticasOnline(1)
+    boceto = BocetoKLL(k)
+    for x in trozos:
+        x = x[~np.isnan(x)]
+        if len(x):
+            acumulado.actualizar(x[:, None])
+            boceto.agregar(x)
+    return acumulado, boceto
+
+
+def resumen_desde_boceto(acumulado, boceto):
+    """
+    Mismas medidas que estadisticas_descriptivas a partir de los acumuladores. Media,
+    desviación, varianza, asimetría, curtosis, mínimo y máximo son exactos; cuartiles y
+    mediana salen del boceto y la moda es el centro del intervalo más denso.
+    """
+    if acumulado.n == 0:
+        return {**dict.fromkeys(MEDIDAS, np.nan), 'Observaciones': 0}
+    q1, mediana, q3 = boceto.cuantil([0.25, 0.50, 0.75])
+    media = acumulado.media[0]
+    desviacion = acumulado.desviacion[0]
+    minimo, maximo = acumulado.minimo[0], acumulado.maximo[0]
+    moda = boceto.moda()
+    return {
+        'Media': media, 'Mediana': mediana, 'Moda': moda, 'Desviación estándar': desviacion,
+        'Varianza': acumulado.varianza[0], 'Rango': maximo - minimo,
+        'Coeficiente de variación': desviacion / media, 'Asimetría': acumulado.asimetria[0],
+        'Curtosis': acumulado.curtosis[0], 'Mínimo': minimo, '1er Cuartil': q1,
+        '3er Cuartil': q3, 'Máximo': maximo, 'Observaciones': acumulado.n,
+    }
+
+
+def bigotes_desde_boceto(boceto, limite_inferior, limite_superior):
+    """
+    Bigotes del diagrama de caja: el mínimo/máximo exacto si cae dentro de los límites de
+    Tukey; si no, el valor retenido por el boceto más cercano al límite por dentro.
+    """
+    dentro = boceto.valores_retenidos()
+    dentro = dentro[(dentro >= limite_inferior) & (dentro <= limite_superior)]
+    bigote_inferior = boceto.minimo if boceto.minimo >= limite_inferior else dentro[0]
+    bigote_superior = boceto.maximo if boceto.maximo <= limite_superior else dentro[-1]
+    return bigote_inferior, bigote_superior
+
+
+def graficar_desde_boceto(estadisticas, boceto, variable, output_dir, en_porcentaje=True, plot_color='lightblue'):
+    """Diagrama de caja e histograma como los del modo de una variable, sin tener los datos."""
+    media, q1, mediana, q3 = (estadisticas[k] for k in ['Media', '1er Cuartil', 'Mediana', '3er Cuartil'])
+    iqr = q3 - q1
+    bigote_inferior, bigote_superior = bigotes_desde_boceto(boceto, q1 - 1.5 * iqr, q3 + 1.5 * iqr)
+
+    # VIsualización del Diagrama de Caja (con las medidas ya calculadas, sin atípicos)
+    fig, ax = plt.subplots(figsize=(5, 6))
+    ax.bxp([{'med': mediana, 'q1': q1, 'q3': q3, 'whislo': bigote_inferior, 'whishi': bigote_superior,
+             'fliers': []}], positions=[0], widths=0.5, patch_artist=True, showfliers=False,
+           boxprops={'facecolor': plot_color}, medianprops={'color': 'black'})
+    ax.axhline(media, color='blue', linestyle='--', linewidth=1.5, label=f'Media ({media*100:.2f}%)')
+
+    posicion_x_cuartiles = 0.41
+    ax.text(posicion_x_cuartiles, mediana, f'Me: {mediana*100:.2f}', va='center', ha='right', size='medium', color='black')
+    ax.text(posicion_x_cuartiles, q3, f'Q3: {q3*100:.2f}', va='center', ha='right', size='medium', color='black')
+    ax.text(posicion_x_cuartiles, q1, f'Q1: {q1*100:.2f}', va='center', ha='right', size='medium', color='black')
+
+    posicion_x_extremos = 0.14
+    ax.text(posicion_x_extremos, bigote_superior, f'Max: {bigote_superior*100:.2f}', va='center', ha='left', size='medium', color='black')
+    ax.text(posicion_x_extremos, bigote_inferior, f'Min: {bigote_inferior*100:.2f}', va='center', ha='left', size='medium', color='black')
+
+    ax.set_title('Diagrama de Caja')
+    ax.yaxis.set_major_formatter(FuncFormatter(lambda y, pos: f'{100 * y:.2f}'))
+    ax.set_ylabel(f'{variable} (%)')
+    ax.set_xlabel('')
+    ax.set_xticks([])
+    ax.legend(loc='upper center', bbox_to_anchor=(0.5, -0.05))
+    plt.tight_layout()
+    plt.savefig(os.path.join(output_dir, f'boxplot_final_con_valores_{variable}.png'))
+    plt.close()
+
+    # HISTOGRAMA (densidad a partir del boceto)
+    conteos, bordes = boceto.histograma(bins=20)
+    densidad = conteos / (conteos.sum() * np.diff(bordes))
+    plt.figure(figsize=(8, 6))
+    plt.bar(bordes[:-1], densidad, width=np.diff(bordes), align='edge', color=plot_color,
+            edgecolor='black', alpha=0.75, label='Histograma')
+    if en_porcentaje:
+        plt.gca().xaxis.set_major_formatter(FuncFormatter(lambda x, pos: f'{100 * x:.1f}%'))
+        plt.xlabel(f'{variable} (%)')
+    else:
+        plt.xlabel(variable)
+    plt.title('Histograma')
+    plt.ylabel('Frecuencia')
+    # Misma campana que norm.fit: media y desviación de máxima verosimilitud (ddof=0)
+    n = estadisticas['Observaciones']
+    std_mv = estadisticas['Desviación estándar'] * np.sqrt((n - 1) / n)
+    xmin, xmax = plt.xlim()
+    x = np.linspace(xmin, xmax, 100)
+    plt.plot(x, norm.pdf(x, media, std_mv), 'k', linewidth=2, label='Campana de Gauss')
+    plt.legend()
+    plt.savefig(os.path.join(output_dir, f'histograma_{variable}.png'))
+    plt.close()
+
 
 # -------------------------------------------------------------------------------------------------------------------------------
 # PREPARACION DE LOS DATOS
 # -------------------------------------------------------------------------------------------------------------------------------
 
 try:
-    # Cargar los datos desde la HOJA ESPECIFICADA del archivo Excel
-    df = pd.read_excel(Entrada, engine='openpyxl', sheet_name=nombre_de_la_hoja)
+    if modo_lote:
+        # Todas las variables numéricas de todas las hojas en un solo archivo
+        datos = datos_lote(Entrada)
+        df_lote = estadisticas_lote(datos)
+        fecha_hora = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        output_excel = os.path.join(base_dir, 'Flujo', 'output', f'estadistica_descriptiva_lote_{fecha_hora}.xlsx')
+        with pd.ExcelWriter(output_excel, engine='openpyxl') as writer:
+            df_lote.to_excel(writer, sheet_name='Estadisticas', index=False)
+            # Misma tabla en formato largo (Medida / Valor), como la salida de una sola variable
+            df_lote.melt(id_vars=['Hoja', 'Variable'], var_name='Medida', value_name='Valor') \
+                .to_excel(writer, sheet_name='Formato_Largo', index=False)
+        print(f"Estadística descriptiva de {len(df_lote)} variables exportada a {output_excel}")
 
-    # Verificar que la columna a analizar exista en la hoja seleccionada
-    if variable not in df.columns:
-        print(f"Error: La columna '{variable}' no se encuentra en la hoja '{nombre_de_la_hoja}'.")
-    else:
+        if graficos_lote:
+            output_dir = os.path.join(base_dir, 'Flujo', 'output', 'box_hist_plots_lote')
+            os.makedirs(output_dir, exist_ok=True)
+            graficar_cuadricula(datos, output_dir, variables_por_figura, columnas_grilla,
+                                mostrar_histograma_en_porcentaje, histograma_numpy)
+            print(f"Gráficos guardados en la carpeta: {output_dir}")
 
-        # --- CÁLCULOS ESTADÍSTICOS Y EXPORTACIÓN A EXCEL (Esta sección no cambia) ---
-        variable_stats = df[variable].describe()
-        moda = df[variable].mode()[0]
-        varianza = df[variable].var()
-        coeficiente_variacion = df[variable].std() / df[variable].mean()
-        rango = variable_stats['max'] - variable_stats['min']
-        asimetria = skew(df[variable].dropna())
-        curtosis_val = kurtosis(df[variable].dropna())
-        
-        stats_dict = {
-            'Medida': ['Media', 'Mediana', 'Moda', 'Desviación estándar', 'Varianza', 'Rango', 
-                       'Coeficiente de variación', 'Asimetría', 'Curtosis', 'Mínimo', '1er Cuartil', 
-                       'Mediana', '3er Cuartil', 'Máximo'],
-            'Valor': [
-                variable_stats['mean'], df[variable].median(), moda, variable_stats['std'], 
-                varianza, rango, coeficiente_variacion, asimetria, curtosis_val, 
-                variable_stats['min'], variable_stats['25%'], variable_stats['50%'], 
-                variable_stats['75%'], variable_stats['max']
-            ]
-        }
-        stats_df = pd.DataFrame(stats_dict)
+    elif archivo_grande:
+        # Archivo grande: una pasada por trozos, sin cargarlo en memoria
+        acumulado, boceto = estadisticas_streaming(leer_por_trozos(archivo_grande, variable, tamano_trozo))
+        estadisticas = resumen_desde_boceto(acumulado, boceto)
+        stats_df = pd.DataFrame({'Medida': MEDIDAS, 'Valor': [estadisticas[medida] for medida in MEDIDAS]})
 
         fecha_hora = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
         output_excel = os.path.join(base_dir, 'Flujo', 'output', f'estadistica_descriptiva_{variable}_{fecha_hora}.xlsx')
         stats_df.to_excel(output_excel, index=False)
-        print(f"Estadística descriptiva exportada a {output_excel}")
+        print(f"Estadística descriptiva de {acumulado.n} observaciones exportada a {output_excel}")
 
-        # Creación de Gráficos
         output_dir = os.path.join(base_dir, 'Flujo', 'output', f'box_hist_plots_{variable}')
         os.makedirs(output_dir, exist_ok=True)
-        plot_color = 'lightblue'
+        graficar_desde_boceto(estadisticas, boceto, variable, output_dir, mostrar_histograma_en_porcentaje)
+        print(f"Gráficos guardados en la carpeta: {output_dir}")
 
-        # VIsualización del Diagrama de Caja
-        fig, ax = plt.subplots(figsize=(5, 6))
-        sns.boxplot(y=df[variable], color=plot_color, ax=ax, width=0.5)
+    else:
+        # Cargar los datos desde la HOJA ESPECIFICADA del archivo Excel
+        df = leer_excel(Entrada, hoja=nombre_de_la_hoja)
+
+        # Verificar que la columna a analizar exista en la hoja seleccionada
+        if variable not in df.columns:
+            print(f"Error: La columna '{variable}' no se encuentra en la hoja '{nombre_de_la_hoja}'.")
+        else:
+
+            # --- CÁLCULOS ESTADÍSTICOS Y EXPORTACIÓN A EXCEL ---
+            estadisticas = estadisticas_descriptivas(df[variable].to_numpy())
+            stats_dict = {
+                'Medida': MEDIDAS,
+                'Valor': [estadisticas[medida] for medida in MEDIDAS]
+            }
+            stats_df = pd.DataFrame(stats_dict)
+
+            fecha_hora = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+            output_excel = os.path.join(base_dir, 'Flujo', 'output', f'estadistica_descriptiva_{variable}_{fecha_hora}.xlsx')
+            stats_df.to_excel(output_excel, index=False)
+            print(f"Estadística descriptiva exportada a {output_excel}")
+
+            # Creación de Gráficos
+            output_dir = os.path.join(base_dir, 'Flujo', 'output', f'box_hist_plots_{variable}')
+            os.makedirs(output_dir, exist_ok=True)
+            plot_color = 'lightblue'
+
+            # VIsualización del Diagrama de Caja
+            fig, ax = plt.subplots(figsize=(5, 6))
+            sns.boxplot(y=df[variable], color=plot_color, ax=ax, width=0.5)
         
-        media = df[variable].mean()
-        q1 = df[variable].quantile(0.25)
-        mediana = df[variable].quantile(0.50)
-        q3 = df[variable].quantile(0.75)
-        iqr = q3 - q1
-        limite_inferior = q1 - 1.5 * iqr
-        bigote_inferior = df[variable][df[variable] >= limite_inferior].min()
-        limite_superior = q3 + 1.5 * iqr
-        bigote_superior = df[variable][df[variable] <= limite_superior].max()
-
-        ax.axhline(media, color='blue', linestyle='--', linewidth=1.5, label=f'Media ({media*100:.2f}%)')
+            media = estadisticas['Media']
+            q1 = estadisticas['1er Cuartil']
+            mediana = estadisticas['Mediana']
+            q3 = estadisticas['3er Cuartil']
+            iqr = q3 - q1
+            limite_inferior = q1 - 1.5 * iqr
+            bigote_inferior = df[variable][df[variable] >= limite_inferior].min()
+            limite_superior = q3 + 1.5 * iqr
+            bigote_superior = df[variable][df[variable] <= limite_superior].max()
+
+            ax.axhline(media, color='blue', linestyle='--', linewidth=1.5, label=f'Media ({media*100:.2f}%)')
         
-        posicion_x_cuartiles = 0.41
-        ax.text(posicion_x_cuartiles, mediana, f'Me: {mediana*100:.2f}', va='center', ha='right', size='medium', color='black')
-        ax.text(posicion_x_cuartiles, q3, f'Q3: {q3*100:.2f}', va='center', ha='right', size='medium', color='black')
-        ax.text(posicion_x_cuartiles, q1, f'Q1: {q1*100:.2f}', va='center', ha='right', size='medium', color='black')
-
-        posicion_x_extremos = 0.14
-        ax.text(posicion_x_extremos, bigote_superior, f'Max: {bigote_superior*100:.2f}', va='center', ha='left', size='medium', color='black')
-        ax.text(posicion_x_extremos, bigote_inferior, f'Min: {bigote_inferior*100:.2f}', va='center', ha='left', size='medium', color='black')
-
-        ax.set_title('Diagrama de Caja') # Título del diagrama de caja
-
-        # Formateador para el eje Y del boxplot
-        def percent_formatter_axis(y, pos):
-            return f'{100 * y:.2f}' 
-        ax.yaxis.set_major_formatter(FuncFormatter(percent_formatter_axis))
-
-        ax.set_ylabel(f'{variable} (%)') 
-        ax.set_xlabel('')
-        ax.set_xticks([])
-        ax.legend(loc='upper center', bbox_to_anchor=(0.5, -0.05)) # Separación del gráfico y la leyenda
+            posicion_x_cuartiles = 0.41
+            ax.text(posicion_x_cuartiles, mediana, f'Me: {mediana*100:.2f}', va='center', ha='right', size='medium', color='black')
+            ax.text(posicion_x_cuartiles, q3, f'Q3: {q3*100:.2f}', va='center', ha='right', size='medium', color='black')
+            ax.text(posicion_x_cuartiles, q1, f'Q1: {q1*100:.2f}', va='center', ha='right', size='medium', color='black')
+
+            posicion_x_extremos = 0.14
+            ax.text(posicion_x_extremos, bigote_superior, f'Max: {bigote_superior*100:.2f}', va='center', ha='left', size='medium', color='black')
+            ax.text(posicion_x_extremos, bigote_inferior, f'Min: {bigote_inferior*100:.2f}', va='center', ha='left', size='medium', color='black')
+
+            ax.set_title('Diagrama de Caja') # Título del diagrama de caja
+
+            # Formateador para el eje Y del boxplot
+            def percent_formatter_axis(y, pos):
+                return f'{100 * y:.2f}' 
+            ax.yaxis.set_major_formatter(FuncFormatter(percent_formatter_axis))
+
+            ax.set_ylabel(f'{variable} (%)') 
+            ax.set_xlabel('')
+            ax.set_xticks([])
+            ax.legend(loc='upper center', bbox_to_anchor=(0.5, -0.05)) # Separación del gráfico y la leyenda
         
-        plt.tight_layout()
-        plt.savefig(os.path.join(output_dir, f'boxplot_final_con_valores_{variable}.png'))
-        plt.close()
+            plt.tight_layout()
+            plt.savefig(os.path.join(output_dir, f'boxplot_final_con_valores_{variable}.png'))
+            plt.close()
         
-        # HISTOGRAMAS
-        plt.figure(figsize=(8, 6))
-        sns.histplot(df[variable].dropna(), color=plot_color, bins=20, stat="density", label='Histograma')
+            # HISTOGRAMAS
+            plt.figure(figsize=(8, 6))
+            sns.histplot(df[variable].dropna(), color=plot_color, bins=20, stat="density", label='Histograma')
         
-        # Formato condicional del eje Y
-        if mostrar_histograma_en_porcentaje:
-            # Si es True, aplica el formato de porcentaje
-            def percent_formatter(x, pos):
-                return f'{100 * x:.1f}%'
-            plt.gca().xaxis.set_major_formatter(FuncFormatter(percent_formatter))
-            plt.xlabel(f'{variable} (%)')
-        else:
-            # Si es False, solo pone la etiqueta normal
-            plt.xlabel(variable)
-
-        plt.title('Histograma') # Titulo del gráfico del histograma
-        plt.ylabel('Frecuencia')
-        mu, std = norm.fit(df[variable].dropna())
-        xmin, xmax = plt.xlim()
-        x = np.linspace(xmin, xmax, 100)
-        p = norm.pdf(x, mu, std)
-        plt.plot(x, p, 'k', linewidth=2, label='Campana de Gauss')
-        plt.legend()
-        plt.savefig(os.path.join(output_dir, f'histograma_{variable}.png'))
-        plt.close()
+            # Formato condicional del eje Y
+            if mostrar_histograma_en_porcentaje:
+                # Si es True, aplica el formato de porcentaje
+                def percent_formatter(x, pos):
+                    return f'{100 * x:.1f}%'
+                plt.gca().xaxis.set_major_formatter(FuncFormatter(percent_formatter))
+                plt.xlabel(f'{variable} (%)')
+            else:
+                # Si es False, solo pone la etiqueta normal
+                plt.xlabel(variable)
 
-        print(f"Gráficos guardados en la carpeta: {output_dir}")
+            plt.title('Histograma') # Titulo del gráfico del histograma
+            plt.ylabel('Frecuencia')
+            mu, std = norm.fit(df[variable].dropna())
+            xmin, xmax = plt.xlim()
+            x = np.linspace(xmin, xmax, 100)
+            p = norm.pdf(x, mu, std)
+            plt.plot(x, p, 'k', linewidth=2, label='Campana de Gauss')
+            plt.legend()
+            plt.savefig(os.path.join(output_dir, f'histograma_{variable}.png'))
+            plt.close()
+
+            print(f"Gráficos guardados en la carpeta: {output_dir}")
 
 except FileNotFoundError:
      # Este error avisa si no existe la entrada de los datos
@@ -1,11 +1,22 @@
 # Linea temporal de las variables
 
 import os
+import sys
+import json
+import hashlib
+import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg') # Sin ventanas: los gráficos solo se guardan en PNG (también en los procesos hijos)
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from matplotlib.ticker import FuncFormatter
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+# Agregar la carpeta padre al path para poder importar módulos desde allí
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Conexiones.lectura_excel import leer_excel
 
 # --- 1. CONFIGURACIÓN DE RUTAS, HOJA Y VARIABLES ---
 
@@ -24,76 +35,266 @@ variables_a_graficar = ['Rendimiento S&P500', 'Rendimiento USGG10YR'] #['WACC',
 # 3. Define los colores para CADA variable en el MISMO ORDEN.
 colores_para_variables = ['blue', 'red'] #['blue', 'red', 'green'] 
 
+# 4. Submuestreo para series largas (p. ej. diarias de varias décadas).
+puntos_objetivo = 2000 # Puntos por serie que se dibujan (None para dibujar todos)
+metodo_submuestreo = 'lttb' # 'lttb' (largest-triangle-three-buckets) o 'minmax' (mínimo y máximo por tramo)
+umbral_marcadores = 500 # Con más puntos que esto se dibuja solo la línea, sin marcadores
+rasterizar_lineas = True # Líneas como imagen dentro del archivo (aligera PDF/SVG si se cambia el formato)
+
+# 5. Modo lote: muchos gráficos (hojas, grupos de variables, colores, rangos de fechas) en una corrida.
+# Cada gráfico del manifiesto se guarda como serie_temporal_<nombre>.png en output_dir_lote y se omite
+# si sus datos y su configuración no cambiaron desde la última corrida.
+modo_lote = False
+archivo_manifiesto = None # JSON con una lista de gráficos como los de abajo (None = usar la lista de abajo)
+manifiesto = [
+    {'nombre': 'mercado_rendimientos', 'hoja': 'Mercado',
+     'variables': ['Rendimiento S&P500', 'Rendimiento USGG10YR'], 'colores': ['blue', 'red'],
+     'titulo': 'Bono con Vencimiento a 10 años (2022-2024)'},
+    {'nombre': 'tasa_libre_riesgo', 'hoja': 'Tasa Libre de Riesgo',
+     'variables': ['Rendimiento'], 'colores': ['green'], 'titulo': 'Tasa Libre de Riesgo', 'desde': '2020-01-01'},
+    {'nombre': 'riesgo_pais', 'hoja': 'Riesgo País',
+     'variables': ['Riesgo Pais'], 'colores': ['black'], 'titulo': 'Riesgo País'},
+]
+output_dir_lote = os.path.join(output_dir, 'series_temporales')
+n_procesos = os.cpu_count() # Procesos que dibujan (1 = en serie)
+
 # --- VALIDACIÓN INICIAL DE COLORES ---
 if len(variables_a_graficar) != len(colores_para_variables):
     raise ValueError("El número de variables a graficar no coincide con el número de colores definidos.")
 
-# --- 2. CARGA Y PREPARACIÓN DE DATOS ---
+# --- FUNCIONES DE SUBMUESTREO ---
+
+def submuestreo_lttb(x, y, n_objetivo):
+    """
+    Índices de los puntos elegidos por Largest-Triangle-Three-Buckets: conserva el primero
+    y el último, y de cada tramo intermedio el punto que forma el triángulo de mayor área
+    con el punto elegido en el tramo anterior y el promedio del tramo siguiente.
+    Mantiene picos y caídas; el bucle es por tramo (n_objetivo), no por punto.
+    """
+    n = len(x)
+    if n_objetivo is None or n <= n_objetivo or n_objetivo < 3:
+        return np.arange(n)
+    bordes = np.linspace(1, n - 1, n_objetivo - 1).astype(np.int64)  # n_objetivo - 2 tramos internos
+    indices = np.empty(n_objetivo, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    anterior = 0
+    for k in range(n_objetivo - 2):
+        inicio, fin = bordes[k], bordes[k + 1]
+        siguiente_fin = bordes[k + 2] if k + 2 < len(bordes) else n
+        x_prom = x[fin:siguiente_fin].mean()
+        y_prom = y[fin:siguiente_fin].mean()
+        # Doble del área del triángulo (anterior, candidato, promedio del tramo siguiente)
+        area = np.abs((x[anterior] - x_prom) * (y[inicio:fin] - y[anterior])
+                      - (x[anterior] - x[inicio:fin]) * (y_prom - y[anterior]))
+        anterior = inicio + int(np.argmax(area))
+        indices[k + 1] = anterior
+    return indices
+
+
+def submuestreo_minmax(y, n_objetivo):
+    """
+    Índices del mínimo y el máximo de cada tramo (n_objetivo / 2 tramos de igual tamaño),
+    más el primer y último punto. Conserva la envolvente de la serie, ideal para datos ruidosos.
+    """
+    n = len(y)
+    if n_objetivo is None or n <= n_objetivo:
+        return np.arange(n)
+    n_tramos = max(n_objetivo // 2, 1)
+    largo = -(-n // n_tramos)
+    # Se rellena con NaN hasta completar una matriz (tramos x largo) y se busca por fila
+    relleno = np.full(n_tramos * largo, np.nan)
+    relleno[:n] = y
+    tramos = relleno.reshape(n_tramos, largo)
+    validos = ~np.all(np.isnan(tramos), axis=1)
+    desplazamiento = np.arange(n_tramos)[validos] * largo
+    minimos = np.nanargmin(tramos[validos], axis=1) + desplazamiento
+    maximos = np.nanargmax(tramos[validos], axis=1) + desplazamiento
+    return np.unique(np.concatenate(([0, n - 1], minimos, maximos)))
+
+
+def submuestrear(fechas, valores, n_objetivo, metodo='lttb'):
+    """Índices de los puntos a dibujar de una serie ordenada por fecha."""
+    if metodo == 'lttb':
+        x = fechas.to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(float)
+        return submuestreo_lttb(x, valores.to_numpy(dtype=float), n_objetivo)
+    if metodo == 'minmax':
+        return submuestreo_minmax(valores.to_numpy(dtype=float), n_objetivo)
+    raise ValueError(f"Método de submuestreo desconocido: '{metodo}'. Use 'lttb' o 'minmax'.")
+
+
+# --- 3. PROCESAMIENTO Y GRÁFICO ---
+
+def preparar_serie(df, variables, desde=None, hasta=None):
+    """Columnas Fecha + variables, con fechas válidas, sin vacíos, ordenadas y dentro del rango pedido."""
+    df_serie = df[['Fecha'] + list(variables)].copy()
+    df_serie['Fecha'] = pd.to_datetime(df_serie['Fecha'], errors='coerce')
+    df_serie.dropna(inplace=True)
+    df_serie = df_serie.sort_values(by='Fecha')
+    if desde is not None:
+        df_serie = df_serie[df_serie['Fecha'] >= pd.Timestamp(desde)]
+    if hasta is not None:
+        df_serie = df_serie[df_serie['Fecha'] <= pd.Timestamp(hasta)]
+    return df_serie
+
+
+def percent_formatter(y, pos):
+    return f'{100 * y:.1f}%'
+
+
+def graficar_serie(df_serie, variables, colores, titulo, ruta_salida_imagen, puntos_objetivo=None,
+                   metodo_submuestreo='lttb', umbral_marcadores=500, rasterizar_lineas=True):
+    """Dibuja una o varias series (ya preparadas) con colores específicos y guarda el PNG."""
+    fig, ax = plt.subplots(figsize=(12, 6))
+
+    # Bucle para graficar una o varias series con colores específicos
+    for variable, color in zip(variables, colores):
+        # Solo los puntos que definen la forma de la serie
+        indices = submuestrear(df_serie['Fecha'], df_serie[variable], puntos_objetivo, metodo_submuestreo)
+        fechas = df_serie['Fecha'].to_numpy()[indices]
+        valores = df_serie[variable].to_numpy()[indices]
+        if len(indices) < len(df_serie):
+            print(f"  '{variable}': {len(df_serie)} puntos -> {len(indices)} ({metodo_submuestreo})")
+
+        ax.plot(fechas, valores,
+                marker='o' if len(indices) <= umbral_marcadores else None, linestyle='-',
+                color=color,
+                label=variable,
+                markersize=3,
+                rasterized=rasterizar_lineas)
+
+    # Formato de ejes y títulos
+    ax.xaxis.set_major_locator(mdates.YearLocator())
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y'))
+    ax.yaxis.set_major_formatter(FuncFormatter(percent_formatter))
+
+    ax.set_title(titulo)
+    ax.set_ylabel('Rendimiento (%)')
+
+    ax.set_xlabel('Años')
+    ax.grid(True)
+
+    # Leyenda
+    ax.legend(loc='upper center', bbox_to_anchor=(0.5, -0.1), ncol=len(variables))
+
+    # Ajustar el diseño DESPUÉS de definir la leyenda para que haya espacio
+    plt.tight_layout()
+
+    # Usar bbox_inches='tight' para asegurar que la leyenda no se corte al guardar
+    plt.savefig(ruta_salida_imagen, bbox_inches='tight')
+    plt.close(fig)
+    return ruta_salida_imagen
 
-try:
-    df = pd.read_excel(Entrada, engine='openpyxl', sheet_name=nombre_de_la_hoja)
 
-    columnas_necesarias = ['Fecha'] + variables_a_graficar
-    columnas_faltantes = [col for col in columnas_necesarias if col not in df.columns]
+def _graficar_tarea(tarea):
+    """Punto de entrada de cada proceso del modo lote."""
+    return graficar_serie(**tarea)
 
-    if columnas_faltantes:
-        print(f"Error: No se encontraron las siguientes columnas en la hoja '{nombre_de_la_hoja}': {columnas_faltantes}")
+
+def huella_grafico(df_serie, config):
+    """Hash de los datos que entran al gráfico y de toda su configuración."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(pd.util.hash_pandas_object(df_serie, index=False).to_numpy().tobytes())
+    h.update(json.dumps(config, sort_keys=True, default=str, ensure_ascii=False).encode())
+    return h.hexdigest()
+
+
+def graficar_lote(entrada, manifiesto, output_dir, n_procesos=1, ajustes_submuestreo=None):
+    """
+    Genera todos los gráficos del manifiesto. Cada hoja se lee una sola vez; los gráficos cuyos
+    datos y configuración tienen la misma huella que en la corrida anterior (registro.json) y
+    cuyo PNG sigue existiendo se omiten. El resto se reparte entre `n_procesos` procesos.
+    Devuelve (generados, omitidos).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    ajustes_submuestreo = ajustes_submuestreo or {}
+    ruta_registro = os.path.join(output_dir, 'registro.json')
+    registro = {}
+    if os.path.exists(ruta_registro):
+        with open(ruta_registro, encoding='utf-8') as f:
+            registro = json.load(f)
+
+    # leer_excel devuelve siempre el DataFrame de la caché (también cuando la crea), así la huella
+    # de los datos es la misma en la primera corrida y en las siguientes
+    hojas = {hoja: leer_excel(entrada, hoja=hoja) for hoja in dict.fromkeys(g['hoja'] for g in manifiesto)}
+
+    tareas, huellas, omitidos = [], {}, []
+    for grafico in manifiesto:
+        nombre, df = grafico['nombre'], hojas[grafico['hoja']]
+        faltantes = [col for col in ['Fecha'] + grafico['variables'] if col not in df.columns]
+        if faltantes:
+            print(f"Error en '{nombre}': no se encontraron las columnas {faltantes} en la hoja '{grafico['hoja']}'.")
+            continue
+        if len(grafico['variables']) != len(grafico['colores']):
+            print(f"Error en '{nombre}': el número de variables no coincide con el número de colores.")
+            continue
+
+        df_serie = preparar_serie(df, grafico['variables'], grafico.get('desde'), grafico.get('hasta'))
+        ruta = os.path.join(output_dir, f'serie_temporal_{nombre}.png')
+        huella = huella_grafico(df_serie, {**grafico, **ajustes_submuestreo})
+        huellas[nombre] = huella
+        if registro.get(nombre) == huella and os.path.exists(ruta):
+            omitidos.append(nombre)
+            continue
+        tareas.append({'df_serie': df_serie, 'variables': grafico['variables'], 'colores': grafico['colores'],
+                       'titulo': grafico.get('titulo', nombre), 'ruta_salida_imagen': ruta, **ajustes_submuestreo})
+
+    if n_procesos > 1 and len(tareas) > 1:
+        with ProcessPoolExecutor(max_workers=min(n_procesos, len(tareas))) as pool:
+            generados = list(pool.map(_graficar_tarea, tareas))
     else:
-        # --- 3. PROCESAMIENTO Y GRÁFICO ---
-        
-        df_serie = df[columnas_necesarias].copy()
-        df_serie['Fecha'] = pd.to_datetime(df_serie['Fecha'], errors='coerce')
-        df_serie.dropna(inplace=True)
-        df_serie = df_serie.sort_values(by='Fecha')
-
-        print(f"Generando gráfico para: {variables_a_graficar}...")
-
-        fig, ax = plt.subplots(figsize=(12, 6))
-
-        # Bucle para graficar una o varias series con colores específicos
-        for i, variable in enumerate(variables_a_graficar):
-            ax.plot(df_serie['Fecha'], df_serie[variable], 
-                    marker='o', linestyle='-', 
-                    color=colores_para_variables[i],
-                    label=variable,
-                    markersize=3)
-
-        # Formato de ejes y títulos
-        ax.xaxis.set_major_locator(mdates.YearLocator())
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y'))
-        
-        def percent_formatter(y, pos):
-            return f'{100 * y:.1f}%'
-        ax.yaxis.set_major_formatter(FuncFormatter(percent_formatter))
-
-        ax.set_title('Bono con Vencimiento a 10 años (2022-2024)')
-        ax.set_ylabel('Rendimiento (%)')
-
-        ax.set_xlabel('Años')
-        ax.grid(True)
-
-        # Leyenda
-        ax.legend(loc='upper center', bbox_to_anchor=(0.5, -0.1), ncol=len(variables_a_graficar))
-        
-        # Ajustar el diseño DESPUÉS de definir la leyenda para que haya espacio
-        plt.tight_layout()
-
-        # --- 4. EXPORTACIÓN DEL GRÁFICO (SOLO PNG) ---
-        
-        fecha_hora = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        
-        nombre_variables = '-'.join(variables_a_graficar)
-        nombre_base = f'serie_temporal_{nombre_variables}_{fecha_hora}'
-
-        ruta_salida_imagen = os.path.join(output_dir, f'{nombre_base}.png')
-        # Usar bbox_inches='tight' para asegurar que la leyenda no se corte al guardar
-        plt.savefig(ruta_salida_imagen, bbox_inches='tight') 
-        plt.close()
-        print(f"Gráfico PNG guardado en: {ruta_salida_imagen}")
-
-except FileNotFoundError:
-    print(f"Error: No se pudo encontrar el archivo de entrada en la ruta: {Entrada}")
-except ValueError as ve:
-    print(f"Error de configuración: {ve}")
-except Exception as e:
-    print(f"Ocurrió un error inesperado: {e}")
\ No newline at end of file
+        generados = [_graficar_tarea(tarea) for tarea in tareas]
+
+    # Solo se registran las huellas de los gráficos que existen
+    registro.update(huellas)
+    with open(ruta_registro, 'w', encoding='utf-8') as f:
+        json.dump(registro, f, indent=2, ensure_ascii=False)
+    return generados, omitidos
+
+
+# Protección necesaria para los procesos hijos del modo lote (en Windows re-importan este script)
+if __name__ == '__main__':
+
+    ajustes_submuestreo = {'puntos_objetivo': puntos_objetivo, 'metodo_submuestreo': metodo_submuestreo,
+                           'umbral_marcadores': umbral_marcadores, 'rasterizar_lineas': rasterizar_lineas}
+
+    # --- 2. CARGA Y PREPARACIÓN DE DATOS ---
+
+    try:
+        if modo_lote:
+            if archivo_manifiesto:
+                with open(archivo_manifiesto, encoding='utf-8') as f:
+                    manifiesto = json.load(f)
+            generados, omitidos = graficar_lote(Entrada, manifiesto, output_dir_lote, n_procesos, ajustes_submuestreo)
+            print(f"{len(generados)} gráficos generados y {len(omitidos)} sin cambios en: {output_dir_lote}")
+
+        else:
+            df = leer_excel(Entrada, hoja=nombre_de_la_hoja)
+
+            columnas_necesarias = ['Fecha'] + variables_a_graficar
+            columnas_faltantes = [col for col in columnas_necesarias if col not in df.columns]
+
+            if columnas_faltantes:
+                print(f"Error: No se encontraron las siguientes columnas en la hoja '{nombre_de_la_hoja}': {columnas_faltantes}")
+            else:
+                df_serie = preparar_serie(df, variables_a_graficar)
+
+                print(f"Generando gráfico para: {variables_a_graficar}...")
+
+                # --- 4. EXPORTACIÓN DEL GRÁFICO (SOLO PNG) ---
+
+                fecha_hora = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+
+                nombre_variables = '-'.join(variables_a_graficar)
+                nombre_base = f'serie_temporal_{nombre_variables}_{fecha_hora}'
+
+                ruta_salida_imagen = os.path.join(output_dir, f'{nombre_base}.png')
+                graficar_serie(df_serie, variables_a_graficar, colores_para_variables,
+                               'Bono con Vencimiento a 10 años (2022-2024)', ruta_salida_imagen, **ajustes_submuestreo)
+                print(f"Gráfico PNG guardado en: {ruta_salida_imagen}")
+
+    except FileNotFoundError:
+        print(f"Error: No se pudo encontrar el archivo de entrada en la ruta: {Entrada}")
+    except ValueError as ve:
+        print(f"Error de configuración: {ve}")
+    except Exception as e:
+        print(f"Ocurrió un error inesperado: {e}")
@@ -1,9 +1,28 @@
 import os
+import sys
+import math
+import tracemalloc
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mtick
 from datetime import datetime
+from time import perf_counter
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor
+from scipy.special import ndtr, ndtri
+from scipy.stats import qmc, truncnorm, t as t_student
+
+# Agregar la carpeta padre al path para poder importar módulos desde allí
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Conexiones.estadistica_streaming import EstadisticasOnline, HistogramaStreaming
+
+# Numba es opcional: sin él, el motor 'fusionado' usa un respaldo en NumPy puro
+try:
+    from numba import njit
+    NUMBA_DISPONIBLE = True
+except ImportError:
+    NUMBA_DISPONIBLE = False
 
 # ==============================================================================
 # 1. FUNCIÓN AUXILIAR: NORMAL TRUNCADA 
@@ -22,12 +41,836 @@ def generar_normal_positiva(media, desviacion, n_iteraciones):
         
     return datos
 
+
+def generar_normal_truncada(media, desviacion, n_iteraciones,
+                            limite_inferior=0.0, limite_superior=np.inf, rng=None):
+    """
+    Genera una normal truncada en [limite_inferior, limite_superior] en una sola
+    pasada vectorizada (método de la CDF inversa), sin bucle de rechazo.
+    Los límites pueden ser escalares o arreglos (un límite por sorteo).
+    """
+    if rng is None:
+        rng = np.random
+    return transformar_normal_truncada(rng.random(n_iteraciones), media, desviacion,
+                                       limite_inferior, limite_superior)
+
+
+def parametros_truncamiento(media, desviacion, limite_inferior, limite_superior):
+    """CDF de los límites estandarizados (cdf_a, cdf_b) y si el intervalo se refleja."""
+    # Límites en la escala estandarizada
+    a = (np.asarray(limite_inferior, dtype=float) - media) / desviacion
+    b = (np.asarray(limite_superior, dtype=float) - media) / desviacion
+    if np.any(a >= b):
+        raise ValueError("El límite inferior debe ser menor que el límite superior.")
+
+    # Si el intervalo está en la cola derecha se refleja para no perder precisión
+    # (ndtr(a) ~ 1 - 1e-17 y la resta se anula)
+    reflejar = a > 0
+    a_r = np.where(reflejar, -b, a)
+    b_r = np.where(reflejar, -a, b)
+    return ndtr(a_r), ndtr(b_r), reflejar
+
+
+def transformar_normal_truncada(u, media, desviacion, limite_inferior=0.0, limite_superior=np.inf):
+    """
+    Lleva uniformes u en (0, 1) a la normal truncada por la CDF inversa.
+    Sirve igual para números pseudoaleatorios que para secuencias Sobol o hipercubo latino.
+    """
+    cdf_a, cdf_b, reflejar = parametros_truncamiento(media, desviacion, limite_inferior, limite_superior)
+    z = ndtri(cdf_a + u * (cdf_b - cdf_a))
+    z = np.where(reflejar, -z, z)
+
+    # Evita que el redondeo deje valores fuera del intervalo
+    datos = np.clip(media + desviacion * z, limite_inferior, limite_superior)
+    return datos
+
+
+def benchmark_normal_truncada(n_iteraciones=1_000_000, media=1.0,
+                              ratios=(0.1, 0.5, 1.0, 2.0, 4.0), repeticiones=3):
+    """
+    Compara el bucle de rechazo (generar_normal_positiva) con la CDF inversa
+    (generar_normal_truncada) para distintas razones volatilidad / media.
+    """
+    filas = []
+    for ratio in ratios:
+        desviacion = media * ratio
+        tiempos = {}
+        for nombre, funcion in [('Rechazo', lambda: generar_normal_positiva(media, desviacion, n_iteraciones)),
+                                ('CDF_inversa', lambda: generar_normal_truncada(media, desviacion, n_iteraciones))]:
+            mejor = np.inf
+            for _ in range(repeticiones):
+                inicio = perf_counter()
+                funcion()
+                mejor = min(mejor, perf_counter() - inicio)
+            tiempos[nombre] = mejor
+        filas.append({
+            'Volatilidad/Media': ratio,
+            'Prob_negativo': ndtr(-1 / ratio),
+            'Rechazo_s': tiempos['Rechazo'],
+            'CDF_inversa_s': tiempos['CDF_inversa'],
+            'Aceleracion': tiempos['Rechazo'] / tiempos['CDF_inversa'],
+        })
+    df_benchmark = pd.DataFrame(filas)
+    print(f"\n--- Benchmark normal truncada ({n_iteraciones} sorteos) ---")
+    print(df_benchmark.to_string(index=False))
+    return df_benchmark
+
+# ==============================================================================
+# 2. MOTOR POR BLOQUES CON ESTADÍSTICAS EN LÍNEA
+# ==============================================================================
+def calcular_wacc(rf, beta, rm, rp, out=None):
+    """
+    Fórmula del WACC a partir de los cuatro insumos simulados.
+    Con `out` se calcula en ese arreglo, operación por operación, sin temporales.
+    """
+    factor_beta = 1+(1-0.295)*(0.0818/0.78967)
+    escudo_deuda = (1-0.295)*0.2104*0.0818
+    if out is None:
+        return (rf + beta*factor_beta * (rm - rf + rp))*0.78967 + escudo_deuda
+    np.subtract(rm, rf, out=out)
+    out += rp
+    out *= beta
+    out *= factor_beta
+    out += rf
+    out *= 0.78967
+    out += escudo_deuda
+    return out
+
+
+def rangos_iniciales(variables, n_desviaciones=8):
+    """
+    Rango de la rejilla de cada boceto: media ± n_desviaciones acotado por los
+    límites de truncamiento; para el WACC se evalúan las esquinas de esos rangos.
+    Depende solo de los parámetros, así que todos los bloques comparten rejilla.
+    """
+    rangos = []
+    for media, desviacion, (minimo, maximo) in variables.values():
+        rangos.append((max(minimo, media - n_desviaciones * desviacion),
+                       min(maximo, media + n_desviaciones * desviacion)))
+    esquinas = [calcular_wacc(*esquina) for esquina in product(*rangos)]
+    return rangos + [(min(esquinas), max(esquinas))]
+
+
+METODOS_MUESTREO = ('pseudoaleatorio', 'sobol', 'latin')
+
+
+def generar_uniformes(m, d, metodo='pseudoaleatorio', rng=None):
+    """
+    Matriz (m, d) de uniformes. 'sobol' y 'latin' son secuencias de baja
+    discrepancia aleatorizadas (Sobol con scrambling / hipercubo latino), así
+    cada bloque es una réplica independiente y se puede estimar su error.
+    Sobol conserva su balance cuando m es potencia de 2.
+    """
+    rng = np.random.default_rng(rng)
+    if metodo == 'pseudoaleatorio':
+        return rng.random((m, d))
+    if metodo == 'sobol':
+        return qmc.Sobol(d, scramble=True, seed=rng).random(m)
+    if metodo == 'latin':
+        return qmc.LatinHypercube(d, seed=rng).random(m)
+    raise ValueError(f"Método de muestreo desconocido: '{metodo}'. Opciones: {METODOS_MUESTREO}")
+
+
+TECNICAS_REDUCCION = ('ninguna', 'antiteticas', 'variable_control', 'estratificado')
+
+
+def aplicar_reduccion_uniformes(u, tecnica='ninguna', columna_estratificada=1, rng=None):
+    """
+    Transforma la matriz de uniformes según la técnica de reducción de varianza:
+    - 'antiteticas': la segunda mitad de las filas es 1 - u de la primera (pares antitéticos).
+    - 'estratificado': la columna `columna_estratificada` (Beta) se reparte en m/2 estratos
+      de igual probabilidad con 2 sorteos por estrato (filas consecutivas).
+    """
+    m = len(u)
+    if tecnica == 'antiteticas':
+        mitad = u[:(m + 1) // 2]
+        return np.concatenate([mitad, 1 - mitad])[:m]
+    if tecnica == 'estratificado':
+        rng = np.random.default_rng(rng)
+        u = u.copy()
+        estratos = np.arange(m) // 2
+        n_estratos = estratos[-1] + 1
+        u[:, columna_estratificada] = (estratos + rng.random(m)) / n_estratos
+        return u
+    if tecnica in ('ninguna', 'variable_control'):
+        return u
+    raise ValueError(f"Técnica de reducción desconocida: '{tecnica}'. Opciones: {TECNICAS_REDUCCION}")
+
+
+def preparar_variable_control(variables, h=1e-6):
+    """
+    Control lineal C = grad(WACC)·(x - E[x]) evaluado en las medias analíticas de las
+    normales truncadas. Como E[C] = 0, su media conocida es el WACC analítico en las medias.
+    Devuelve (medias_analiticas, gradiente).
+    """
+    medias = np.array([truncnorm.mean((minimo - media) / desviacion, (maximo - media) / desviacion,
+                                      loc=media, scale=desviacion)
+                       for media, desviacion, (minimo, maximo) in variables.values()])
+    gradiente = np.array([(calcular_wacc(*(medias + h * e)) - calcular_wacc(*(medias - h * e))) / (2 * h)
+                          for e in np.eye(len(medias))])
+    return medias, gradiente
+
+
+def media_con_reduccion(wacc, insumos, tecnica='ninguna', control=None):
+    """
+    Estimación de la media del WACC en un bloque y la varianza de esa estimación
+    bajo la técnica usada. Devuelve (media, varianza_media, varianza_simple) donde
+    varianza_simple = s²/m es la varianza que tendría un muestreo sin reducción.
+    """
+    m = len(wacc)
+    if m < 2:
+        raise ValueError("Cada bloque necesita al menos 2 sorteos para estimar su varianza.")
+    varianza_simple = wacc.var(ddof=1) / m
+    pares = m // 2
+    if tecnica == 'antiteticas':
+        # La fila i se refleja en la fila i + (m+1)//2; con m impar la fila (m-1)//2 queda sin pareja
+        desfase = (m + 1) // 2
+        sumas = wacc[:pares] + wacc[desfase:desfase + pares]
+        suelta = wacc.var(ddof=1) if m % 2 else 0.0
+        return wacc.mean(), (pares * sumas.var(ddof=1) + suelta) / m**2, varianza_simple
+    if tecnica == 'estratificado':
+        # Dentro de cada estrato (2 sorteos): s_h² = (y1 - y2)² / 2. Con m impar el último
+        # estrato tiene un solo sorteo: pesa lo mismo que los demás y toma su s_h² promedio
+        n_estratos = (m + 1) // 2
+        medias_estrato = np.append((wacc[0:2 * pares:2] + wacc[1:2 * pares:2]) / 2, wacc[2 * pares:])
+        varianzas_estrato = (wacc[0:2 * pares:2] - wacc[1:2 * pares:2])**2 / 4
+        if m % 2:
+            varianzas_estrato = np.append(varianzas_estrato, varianzas_estrato.mean())
+        return medias_estrato.mean(), varianzas_estrato.sum() / n_estratos**2, varianza_simple
+    if tecnica == 'variable_control':
+        medias_analiticas, gradiente = control
+        c = (np.column_stack(insumos) - medias_analiticas) @ gradiente
+        coef = np.cov(wacc, c)[0, 1] / c.var(ddof=1)
+        ajustada = wacc - coef * c
+        return ajustada.mean(), ajustada.var(ddof=1) / m, varianza_simple
+    return wacc.mean(), varianza_simple, varianza_simple
+
+
+class EstimadorMedia:
+    """Acumula la media del WACC y la varianza de su estimación a través de los bloques."""
+
+    def __init__(self, tecnica='ninguna'):
+        self.tecnica = tecnica
+        self.n = 0
+        self.suma = 0.0
+        self.suma_varianza = 0.0
+        self.suma_varianza_simple = 0.0
+
+    def agregar(self, m, media, varianza_media, varianza_simple):
+        # Bloques independientes: media ponderada por tamaño, varianzas con peso m²
+        self.n += m
+        self.suma += m * media
+        self.suma_varianza += m**2 * varianza_media
+        self.suma_varianza_simple += m**2 * varianza_simple
+
+    @property
+    def media(self):
+        return self.suma / self.n
+
+    @property
+    def varianza_media(self):
+        return self.suma_varianza / self.n**2
+
+    @property
+    def factor_reduccion(self):
+        return self.suma_varianza_simple / self.suma_varianza
+
+    @property
+    def tamano_efectivo(self):
+        return self.n * self.factor_reduccion
+
+    def resumen(self):
+        return pd.DataFrame({
+            'Tecnica': [self.tecnica],
+            'Media_WACC': [self.media],
+            'Error_estandar': [np.sqrt(self.varianza_media)],
+            'Factor_reduccion_varianza': [self.factor_reduccion],
+            'Tamano_efectivo_muestra': [self.tamano_efectivo],
+            'Iteraciones': [self.n],
+        })
+
+
+def _simular_bloque(tarea):
+    """Simula un bloque con su propio generador y devuelve sus estadísticas parciales."""
+    if tarea['motor'] == 'fusionado':
+        return _simular_bloque_fusionado(tarea)
+    variables, m = tarea['variables'], tarea['m']
+    rng = np.random.default_rng(tarea['semilla'])
+    u = generar_uniformes(m, len(variables), tarea['metodo'], rng)
+    u = aplicar_reduccion_uniformes(u, tarea['tecnica'], rng=rng)
+    insumos = [transformar_normal_truncada(u[:, j], media, desviacion, *limites)
+               for j, (media, desviacion, limites) in enumerate(variables.values())]
+    wacc = calcular_wacc(*insumos)
+    bloque = np.column_stack(insumos + [wacc])
+
+    estadisticas = EstadisticasOnline(bloque.shape[1])
+    estadisticas.actualizar(bloque)
+    bocetos = [HistogramaStreaming(rango=rango) for rango in tarea['rangos']]
+    for j, boceto in enumerate(bocetos):
+        boceto.agregar(bloque[:, j])
+    estimacion = (m, *media_con_reduccion(wacc, insumos, tarea['tecnica'], tarea['control']))
+    return estadisticas, bocetos, estimacion, (bloque if tarea['guardar_sorteos'] else None)
+
+
+def _crear_tareas(variables, tamanos, semillas, rangos, metodo, tecnica, guardar_sorteos=False, motor='numpy'):
+    if motor not in MOTORES_CALCULO:
+        raise ValueError(f"Motor de cálculo desconocido: '{motor}'. Opciones: {MOTORES_CALCULO}")
+    if motor == 'fusionado' and (metodo != 'pseudoaleatorio' or tecnica != 'ninguna' or guardar_sorteos):
+        raise ValueError("El motor 'fusionado' solo admite muestreo pseudoaleatorio, sin reducción "
+                         "de varianza y sin guardar los sorteos.")
+    control = preparar_variable_control(variables) if tecnica == 'variable_control' else None
+    return [{'variables': variables, 'm': m, 'semilla': semilla_bloque, 'rangos': rangos,
+             'metodo': metodo, 'tecnica': tecnica, 'control': control,
+             'guardar_sorteos': guardar_sorteos, 'motor': motor}
+            for m, semilla_bloque in zip(tamanos, semillas)]
+
+
+def tamanos_bloques(n_iteraciones, tamano_bloque, tecnica='ninguna'):
+    """
+    Reparte n_iteraciones en bloques de tamano_bloque. Con técnicas por pares
+    ('antiteticas', 'estratificado') el tamaño se redondea a par, y un último
+    bloque de un solo sorteo se une al anterior (no permite estimar su varianza).
+    """
+    if tecnica in ('antiteticas', 'estratificado'):
+        tamano_bloque += tamano_bloque % 2
+    tamanos = [min(tamano_bloque, n_iteraciones - inicio) for inicio in range(0, n_iteraciones, tamano_bloque)]
+    if len(tamanos) > 1 and tamanos[-1] < 2:
+        ultimo = tamanos.pop()
+        tamanos[-1] += ultimo
+    return tamanos
+
+
+def _mapear_bloques(n_procesos):
+    """Devuelve (map, ejecutor): map ordenado en serie o sobre un pool de procesos."""
+    if n_procesos > 1:
+        ejecutor = ProcessPoolExecutor(max_workers=n_procesos)
+        return ejecutor.map, ejecutor
+    return map, None
+
+
+def simular_wacc_por_bloques(variables, n_iteraciones, tamano_bloque=1_000_000,
+                             escritor=None, semilla=42, n_procesos=1,
+                             metodo='pseudoaleatorio', tecnica='ninguna', motor='numpy'):
+    """
+    Genera y evalúa el WACC bloque a bloque. Solo se mantienen las estadísticas
+    en línea y un boceto de cuantiles por columna, por lo que la memoria no
+    depende de n_iteraciones. Si se pasa un `escritor` (ver sección 4), cada
+    bloque se vuelca a disco en formato columnar a medida que llega.
+
+    Cada bloque usa un generador independiente derivado de `semilla`
+    (SeedSequence.spawn) y los parciales se unen siempre en el orden de los
+    bloques, así el resultado es idéntico con 1 o con N procesos.
+
+    variables: dict {columna: (media, desviacion, (minimo, maximo))} con el orden rf, beta, rm, rp.
+    tecnica: reducción de varianza (ver TECNICAS_REDUCCION).
+    motor: 'numpy' (arreglos por bloque) o 'fusionado' (un solo bucle, ver sección 3).
+    Devuelve (columnas, estadisticas, bocetos, estimador), donde estimador es el
+    EstimadorMedia del WACC con su factor de reducción.
+    """
+    columnas = list(variables) + ['WACC_Simulado']
+    rangos = rangos_iniciales(variables)
+    estadisticas = EstadisticasOnline(len(columnas))
+    bocetos = [HistogramaStreaming(rango=rango) for rango in rangos]
+    estimador = EstimadorMedia(tecnica)
+    guardar_sorteos = escritor is not None
+
+    tamanos = tamanos_bloques(n_iteraciones, tamano_bloque, tecnica)
+    semillas = np.random.SeedSequence(semilla).spawn(len(tamanos))
+    tareas = _crear_tareas(variables, tamanos, semillas, rangos, metodo, tecnica, guardar_sorteos, motor)
+
+    # Más procesos que bloques no aportan nada: con un solo bloque se corre en serie
+    mapear, ejecutor = _mapear_bloques(min(n_procesos, len(tareas)))
+    try:
+        # map() entrega los bloques en orden, sin importar qué proceso terminó primero
+        for estadisticas_bloque, bocetos_bloque, estimacion, bloque in mapear(_simular_bloque, tareas):
+            estadisticas.combinar(estadisticas_bloque)
+            for boceto, boceto_bloque in zip(bocetos, bocetos_bloque):
+                boceto.combinar(boceto_bloque)
+            estimador.agregar(*estimacion)
+            if guardar_sorteos:
+                escritor.escribir(bloque)
+    finally:
+        if ejecutor is not None:
+            ejecutor.shutdown()
+        if guardar_sorteos:
+            escritor.cerrar()
+
+    return columnas, estadisticas, bocetos, estimador
+
+
+def simular_wacc_adaptativo(variables, tolerancia, percentiles=(2.5, 97.5), tamano_lote=2**14,
+                            max_iteraciones=10_000_000, min_lotes=8, confianza=0.95,
+                            semilla=42, n_procesos=1, metodo='sobol', tecnica='ninguna', motor='numpy'):
+    """
+    Agrega lotes independientes hasta que el semiancho del intervalo de confianza
+    de la media del WACC y de sus percentiles sea menor que `tolerancia`.
+    El error se estima con la dispersión entre lotes (cada lote es una réplica
+    con su propia semilla o su propia aleatorización de la secuencia QMC).
+
+    Devuelve (columnas, estadisticas, bocetos, estimador, df_convergencia) donde
+    df_convergencia tiene la estimación y el semiancho de cada medida.
+    """
+    columnas = list(variables) + ['WACC_Simulado']
+    rangos = rangos_iniciales(variables)
+    estadisticas = EstadisticasOnline(len(columnas))
+    bocetos = [HistogramaStreaming(rango=rango) for rango in rangos]
+    estimador = EstimadorMedia(tecnica)
+    raiz = np.random.SeedSequence(semilla)
+    if tecnica in ('antiteticas', 'estratificado'):
+        tamano_lote += tamano_lote % 2
+    # Se lanzan tantos lotes como procesos, pero se incorporan en el orden de sus
+    # semillas y la convergencia se revisa tras cada uno: el lote i siempre usa el
+    # hijo i de la semilla raíz y el corte no depende de n_procesos
+    lotes_por_ronda = max(n_procesos, 1)
+
+    estimaciones_lote = []
+    semiancho = np.full(1 + len(percentiles), np.inf)
+    mapear, ejecutor = _mapear_bloques(n_procesos)
+    try:
+        convergio = False
+        while not convergio and estadisticas.n < max_iteraciones:
+            tareas = _crear_tareas(variables, [tamano_lote] * lotes_por_ronda, raiz.spawn(lotes_por_ronda),
+                                   rangos, metodo, tecnica, motor=motor)
+            for estadisticas_lote, bocetos_lote, estimacion, _ in mapear(_simular_bloque, tareas):
+                estadisticas.combinar(estadisticas_lote)
+                for boceto, boceto_lote in zip(bocetos, bocetos_lote):
+                    boceto.combinar(boceto_lote)
+                estimador.agregar(*estimacion)
+                # estimacion[1] es la media del lote ya corregida por la técnica de reducción
+                estimaciones_lote.append([estimacion[1], *bocetos_lote[-1].percentil(percentiles)])
+
+                k = len(estimaciones_lote)
+                if k >= min_lotes:
+                    t_critico = t_student.ppf((1 + confianza) / 2, k - 1)
+                    semiancho = t_critico * np.std(estimaciones_lote, axis=0, ddof=1) / np.sqrt(k)
+                    convergio = bool(np.all(semiancho < tolerancia))
+                # Los lotes sobrantes de la ronda se descartan
+                if convergio or estadisticas.n >= max_iteraciones:
+                    break
+    finally:
+        if ejecutor is not None:
+            ejecutor.shutdown()
+
+    df_convergencia = pd.DataFrame({
+        'Medida': ['Media'] + [f'Percentil {p:g}%' for p in percentiles],
+        'Estimacion': [estimador.media, *bocetos[-1].percentil(percentiles)],
+        'Semiancho_IC': semiancho,
+        'Tolerancia': tolerancia,
+        'Convergio': semiancho < tolerancia,
+        'Iteraciones': estadisticas.n,
+        'Metodo': metodo,
+    })
+    return columnas, estadisticas, bocetos, estimador, df_convergencia
+
+
+def comparar_metodos_muestreo(variables, tolerancia, percentiles=(2.5, 97.5), semilla=42, n_procesos=1):
+    """Iteraciones y tiempo que necesita cada método de muestreo para alcanzar la misma tolerancia."""
+    filas = []
+    for metodo in METODOS_MUESTREO:
+        inicio = perf_counter()
+        *_, df_convergencia = simular_wacc_adaptativo(variables, tolerancia, percentiles,
+                                                      semilla=semilla, n_procesos=n_procesos, metodo=metodo)
+        filas.append({'Metodo': metodo, 'Iteraciones': df_convergencia['Iteraciones'].iloc[0],
+                      'Convergio': df_convergencia['Convergio'].all(), 'Tiempo_s': perf_counter() - inicio})
+    df_comparacion = pd.DataFrame(filas)
+    print(f"\n--- Iteraciones necesarias para semiancho < {tolerancia:.4%} ---")
+    print(df_comparacion.to_string(index=False))
+    return df_comparacion
+
+
+def medir_escalamiento(variables, n_iteraciones, tamano_bloque, max_procesos=None, semilla=42):
+    """Tiempo de la simulación con 1..max_procesos procesos y verificación de reproducibilidad."""
+    max_procesos = max_procesos or os.cpu_count()
+    filas = []
+    referencia = None
+    for n_procesos in range(1, max_procesos + 1):
+        inicio = perf_counter()
+        _, estadisticas, bocetos, _ = simular_wacc_por_bloques(
+            variables, n_iteraciones, tamano_bloque, semilla=semilla, n_procesos=n_procesos)
+        tiempo = perf_counter() - inicio
+        resultado = (estadisticas.media, estadisticas.m2, bocetos[-1].conteos)
+        if referencia is None:
+            referencia = (tiempo, resultado)
+        identico = all(np.array_equal(a, b) for a, b in zip(resultado, referencia[1]))
+        filas.append({'Procesos': n_procesos, 'Tiempo_s': tiempo,
+                      'Aceleracion': referencia[0] / tiempo, 'Identico_a_1_proceso': identico})
+    df_escalamiento = pd.DataFrame(filas)
+    print(f"\n--- Escalamiento ({n_iteraciones} iteraciones, bloques de {tamano_bloque}) ---")
+    print(df_escalamiento.to_string(index=False))
+    return df_escalamiento
+
+
+def resumen_estadistico(columnas, estadisticas, bocetos):
+    """Tabla equivalente a DataFrame.describe() (más asimetría y curtosis) a partir de los bocetos."""
+    cuartiles = np.array([b.cuantil([0.25, 0.50, 0.75]) for b in bocetos]).T
+    return pd.DataFrame(
+        [np.full(len(columnas), estadisticas.n, dtype=float), estadisticas.media, estadisticas.desviacion,
+         estadisticas.minimo, *cuartiles, estadisticas.maximo, estadisticas.asimetria, estadisticas.curtosis],
+        index=['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max', 'skew', 'kurtosis'],
+        columns=columnas)
+
+
+def tabla_percentiles(columnas, bocetos, percentiles=(1, 2.5, 5, 10, 25, 50, 75, 90, 95, 97.5, 99)):
+    """Percentiles de cada columna a partir de los bocetos."""
+    return pd.DataFrame({columna: boceto.percentil(percentiles) for columna, boceto in zip(columnas, bocetos)},
+                        index=pd.Index([f'{p:g}%' for p in percentiles], name='Percentil'))
+
 # ==============================================================================
-# 2. SECCIÓN DE VARIABLES (INPUTS)
+# 3. NÚCLEO FUSIONADO: MUESTREO + WACC + ESTADÍSTICAS EN UN SOLO RECORRIDO
+# ==============================================================================
+MOTORES_CALCULO = ('numpy', 'fusionado')
+
+
+def _preparar_nucleo(variables, rangos):
+    """Parámetros del núcleo en arreglos planos (uno por variable / columna)."""
+    medias = np.array([v[0] for v in variables.values()], dtype=float)
+    desviaciones = np.array([v[1] for v in variables.values()], dtype=float)
+    lim_inf = np.array([v[2][0] for v in variables.values()], dtype=float)
+    lim_sup = np.array([v[2][1] for v in variables.values()], dtype=float)
+    cdf_a, cdf_b, reflejar = parametros_truncamiento(medias, desviaciones, lim_inf, lim_sup)
+    inicio = np.array([r[0] for r in rangos], dtype=float)
+    ancho = np.array([(r[1] - r[0]) for r in rangos], dtype=float)
+    return medias, desviaciones, lim_inf, lim_sup, cdf_a, cdf_b, reflejar, inicio, ancho
+
+
+if NUMBA_DISPONIBLE:
+    _calcular_wacc_jit = njit(calcular_wacc)
+
+    @njit(cache=True)
+    def _ndtri_escalar(p):
+        """Inversa de la normal estándar (Acklam) con un paso de Halley: precisión de máquina."""
+        if p <= 0.0:
+            return -np.inf
+        if p >= 1.0:
+            return np.inf
+        if p < 0.02425:
+            q = math.sqrt(-2.0 * math.log(p))
+            x = ((((((-7.784894002430293e-03 * q - 3.223964580411365e-01) * q - 2.400758277161838e+00) * q
+                    - 2.549732539343734e+00) * q + 4.374664141464968e+00) * q + 2.938163982698783e+00)
+                 / ((((7.784695709041462e-03 * q + 3.224671290700398e-01) * q + 2.445134137142996e+00) * q
+                     + 3.754408661907416e+00) * q + 1.0))
+        elif p <= 1.0 - 0.02425:
+            q = p - 0.5
+            r = q * q
+            x = ((((((-3.969683028665376e+01 * r + 2.209460984245205e+02) * r - 2.759285104469687e+02) * r
+                    + 1.383577518672690e+02) * r - 3.066479806614716e+01) * r + 2.506628277459239e+00) * q
+                 / (((((-5.447609879822406e+01 * r + 1.615858368580409e+02) * r - 1.556989798598866e+02) * r
+                      + 6.680131188771972e+01) * r - 1.328068155288572e+01) * r + 1.0))
+        else:
+            q = math.sqrt(-2.0 * math.log(1.0 - p))
+            x = -((((((-7.784894002430293e-03 * q - 3.223964580411365e-01) * q - 2.400758277161838e+00) * q
+                     - 2.549732539343734e+00) * q + 4.374664141464968e+00) * q + 2.938163982698783e+00)
+                  / ((((7.784695709041462e-03 * q + 3.224671290700398e-01) * q + 2.445134137142996e+00) * q
+                      + 3.754408661907416e+00) * q + 1.0))
+        e = 0.5 * math.erfc(-x / math.sqrt(2.0)) - p
+        u = e * math.sqrt(2.0 * math.pi) * math.exp(x * x / 2.0)
+        return x - u / (1.0 + x * u / 2.0)
+
+    @njit(cache=True)
+    def _nucleo_wacc_numba(m, rng, medias, desviaciones, lim_inf, lim_sup, cdf_a, cdf_b, reflejar,
+                           inicio, ancho, conteos, media, m2, m3, m4, minimo, maximo):
+        """
+        Un solo bucle: sortea rf, beta, rm y rp, evalúa el WACC y actualiza momentos
+        (Welford/Terriberry), extremos y el histograma fino de cada columna.
+        Consume los uniformes en el mismo orden que rng.random((m, 4)).
+        """
+        d = len(medias)
+        n_celdas = conteos.shape[1]
+        x = np.empty(d + 1)
+        for i in range(m):
+            for j in range(d):
+                z = _ndtri_escalar(cdf_a[j] + rng.random() * (cdf_b[j] - cdf_a[j]))
+                if reflejar[j]:
+                    z = -z
+                x[j] = min(max(medias[j] + desviaciones[j] * z, lim_inf[j]), lim_sup[j])
+            x[d] = _calcular_wacc_jit(x[0], x[1], x[2], x[3])
+
+            n = i + 1
+            for j in range(d + 1):
+                delta = x[j] - media[j]
+                delta_n = delta / n
+                delta_n2 = delta_n * delta_n
+                termino = delta * delta_n * (n - 1)
+                media[j] += delta_n
+                m4[j] += termino * delta_n2 * (n * n - 3 * n + 3) + 6 * delta_n2 * m2[j] - 4 * delta_n * m3[j]
+                m3[j] += termino * delta_n * (n - 2) - 3 * delta_n * m2[j]
+                m2[j] += termino
+                minimo[j] = min(minimo[j], x[j])
+                maximo[j] = max(maximo[j], x[j])
+                # La rejilla viene de rangos_iniciales (±8 desviaciones): fuera de ella se acota al borde
+                celda = int((x[j] - inicio[j]) / ancho[j] * n_celdas)
+                conteos[j, min(max(celda, 0), n_celdas - 1)] += 1.0
+
+
+def _nucleo_wacc_numpy(m, rng, medias, desviaciones, lim_inf, lim_sup, cdf_a, cdf_b, reflejar,
+                       inicio, ancho, conteos, estadisticas, sub_bloque=262_144):
+    """
+    Respaldo sin numba: recorre el bloque en sub-bloques de tamaño fijo y
+    reutiliza los mismos búferes con operaciones in situ (sin temporales).
+    """
+    d = len(medias)
+    n_celdas = conteos.shape[1]
+    u = np.empty((sub_bloque, d))
+    x = np.empty((sub_bloque, d + 1))
+    posicion = np.empty(sub_bloque)
+    celdas = np.empty(sub_bloque, dtype=np.int64)
+    for desde in range(0, m, sub_bloque):
+        k = min(sub_bloque, m - desde)
+        uk, xk = u[:k], x[:k]
+        rng.random(out=uk)
+        # Normal truncada in situ: cdf_a + u * (cdf_b - cdf_a) -> ndtri -> reflejo -> escala
+        uk *= cdf_b - cdf_a
+        uk += cdf_a
+        ndtri(uk, out=xk[:, :d])
+        xk[:, :d] *= np.where(reflejar, -desviaciones, desviaciones)
+        xk[:, :d] += medias
+        np.clip(xk[:, :d], lim_inf, lim_sup, out=xk[:, :d])
+        calcular_wacc(xk[:, 0], xk[:, 1], xk[:, 2], xk[:, 3], out=xk[:, d])
+
+        estadisticas.actualizar(xk)
+        for j in range(d + 1):
+            pk = posicion[:k]
+            np.subtract(xk[:, j], inicio[j], out=pk)
+            pk *= n_celdas / ancho[j]
+            np.clip(pk, 0, n_celdas - 1, out=pk)
+            celdas[:k] = pk
+            conteos[j] += np.bincount(celdas[:k], minlength=n_celdas)
+
+
+def _simular_bloque_fusionado(tarea):
+    """Versión de _simular_bloque que nunca materializa los sorteos del bloque completo."""
+    variables, m, rangos = tarea['variables'], tarea['m'], tarea['rangos']
+    rng = np.random.default_rng(tarea['semilla'])
+    parametros = _preparar_nucleo(variables, rangos)
+    d = len(variables)
+    bocetos = [HistogramaStreaming(rango=rango) for rango in rangos]
+    conteos = np.zeros((d + 1, bocetos[0].n_celdas))
+    estadisticas = EstadisticasOnline(d + 1)
+
+    if NUMBA_DISPONIBLE:
+        estadisticas.n = m
+        _nucleo_wacc_numba(m, rng, *parametros, conteos, estadisticas.media, estadisticas.m2,
+                           estadisticas.m3, estadisticas.m4, estadisticas.minimo, estadisticas.maximo)
+    else:
+        _nucleo_wacc_numpy(m, rng, *parametros, conteos, estadisticas)
+
+    for j, boceto in enumerate(bocetos):
+        boceto.conteos = conteos[j]
+        boceto.minimo, boceto.maximo = estadisticas.minimo[j], estadisticas.maximo[j]
+    varianza_media = estadisticas.varianza[-1] / m
+    estimacion = (m, estadisticas.media[-1], varianza_media, varianza_media)
+    return estadisticas, bocetos, estimacion, None
+
+
+def benchmark_nucleo_fusionado(variables, n_iteraciones=10_000_000, tamano_bloque=1_000_000, semilla=42):
+    """Tiempo, rendimiento y pico de memoria del motor NumPy frente al núcleo fusionado."""
+    if NUMBA_DISPONIBLE:
+        # Compila el núcleo antes de medir
+        simular_wacc_por_bloques(variables, 1000, semilla=semilla, motor='fusionado')
+    filas = []
+    for motor in MOTORES_CALCULO:
+        tracemalloc.start()
+        inicio = perf_counter()
+        _, estadisticas, bocetos, _ = simular_wacc_por_bloques(
+            variables, n_iteraciones, tamano_bloque, semilla=semilla, motor=motor)
+        tiempo = perf_counter() - inicio
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        filas.append({'Motor': motor if motor == 'numpy' else f"fusionado ({'numba' if NUMBA_DISPONIBLE else 'numpy in situ'})",
+                      'Tiempo_s': tiempo, 'Millones_por_s': n_iteraciones / tiempo / 1e6,
+                      'Pico_memoria_MB': pico / 2**20, 'Media_WACC': estadisticas.media[-1],
+                      'Percentil_97.5': bocetos[-1].percentil(97.5)})
+    df_benchmark = pd.DataFrame(filas)
+    print(f"\n--- Benchmark núcleo fusionado ({n_iteraciones} iteraciones, bloques de {tamano_bloque}) ---")
+    print(df_benchmark.to_string(index=False))
+    return df_benchmark
+
+# ==============================================================================
+# 4. SORTEOS EN FORMATO COLUMNAR (NPY CON MEMMAP / PARQUET)
+# ==============================================================================
+FORMATOS_SORTEOS = ('npy', 'parquet')
+
+
+class EscritorSorteosNpy:
+    """
+    Un archivo .npy por columna dentro de `directorio`, escrito bloque a bloque
+    sobre un memmap ya dimensionado. Se lee sin reparsear con cargar_sorteos().
+    """
+
+    def __init__(self, directorio, columnas, n_filas):
+        os.makedirs(directorio, exist_ok=True)
+        self.ruta = directorio
+        self.mapas = {columna: np.lib.format.open_memmap(os.path.join(directorio, f'{columna}.npy'),
+                                                         mode='w+', dtype=np.float64, shape=(n_filas,))
+                      for columna in columnas}
+        self.fila = 0
+
+    def escribir(self, bloque):
+        m = len(bloque)
+        for j, mapa in enumerate(self.mapas.values()):
+            mapa[self.fila:self.fila + m] = bloque[:, j]
+        self.fila += m
+
+    def cerrar(self):
+        for mapa in self.mapas.values():
+            mapa.flush()
+        self.mapas = {}
+
+
+class EscritorSorteosParquet:
+    """Un archivo Parquet comprimido (zstd) con un grupo de filas por bloque. Requiere pyarrow."""
+
+    def __init__(self, ruta, columnas, n_filas=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("El formato 'parquet' requiere pyarrow (pip install pyarrow); use 'npy'.")
+        self.pa = pa
+        self.ruta = ruta
+        self.columnas = columnas
+        esquema = pa.schema([(columna, pa.float64()) for columna in columnas])
+        self.writer = pq.ParquetWriter(ruta, esquema, compression='zstd')
+
+    def escribir(self, bloque):
+        tabla = self.pa.table({columna: bloque[:, j] for j, columna in enumerate(self.columnas)})
+        self.writer.write_table(tabla)
+
+    def cerrar(self):
+        self.writer.close()
+
+
+def crear_escritor_sorteos(formato, ruta_base, columnas, n_filas):
+    """Escritor para `formato` ('npy' -> carpeta ruta_base, 'parquet' -> ruta_base.parquet)."""
+    if formato == 'npy':
+        return EscritorSorteosNpy(ruta_base, columnas, n_filas)
+    if formato == 'parquet':
+        return EscritorSorteosParquet(f'{ruta_base}.parquet', columnas, n_filas)
+    raise ValueError(f"Formato de sorteos desconocido: '{formato}'. Opciones: {FORMATOS_SORTEOS}")
+
+
+def cargar_sorteos(ruta, columnas=None):
+    """
+    Carga los sorteos guardados por la simulación.
+    - Carpeta .npy: devuelve {columna: memmap de solo lectura}; no se lee nada hasta usarlo.
+    - Archivo .parquet: devuelve un DataFrame con solo las columnas pedidas.
+
+    Ejemplo desde otro script:
+        sorteos = cargar_sorteos('Flujo/output/sorteos_WACC_20250101_120000', ['WACC_Simulado'])
+        wacc = sorteos['WACC_Simulado']
+    """
+    if os.path.isdir(ruta):
+        disponibles = [os.path.splitext(f)[0] for f in sorted(os.listdir(ruta)) if f.endswith('.npy')]
+        return {columna: np.load(os.path.join(ruta, f'{columna}.npy'), mmap_mode='r')
+                for columna in (columnas or disponibles)}
+    return pd.read_parquet(ruta, columns=columnas)
+
+# ==============================================================================
+# 5. SENSIBILIDAD: MUCHOS ESCENARIOS EN UN SOLO CÁLCULO (TORNADO)
+# ==============================================================================
+# Columnas de un escenario, en el mismo orden que las variables simuladas (media, volatilidad)
+COLUMNAS_ESCENARIO = (('rf_base', 'volatilidad_rf'),
+                      ('beta_base', 'volatilidad_beta'),
+                      ('rm_base', 'volatilidad_rm'),
+                      ('riesgo_pais', 'volatilidad_rp'))
+
+
+def parametros_base(variables):
+    """Valores base de las columnas de escenario tomados de las variables simuladas."""
+    base = {}
+    for (col_media, col_volatilidad), (media, desviacion, _) in zip(COLUMNAS_ESCENARIO, variables.values()):
+        base[col_media] = media
+        base[col_volatilidad] = desviacion
+    return base
+
+
+def generar_grilla(**valores):
+    """Producto cartesiano de listas de valores, p. ej. generar_grilla(beta_base=[...], rm_base=[...])."""
+    indice = pd.MultiIndex.from_product(list(valores.values()), names=list(valores))
+    return indice.to_frame(index=False)
+
+
+def evaluar_escenarios(df_escenarios, variables, n_sorteos=2000, percentiles=(2.5, 97.5),
+                       semilla=42, escenarios_por_bloque=500):
+    """
+    Evalúa todos los escenarios a la vez con una matriz (escenarios × sorteos).
+    Todos los escenarios comparten los mismos uniformes (números aleatorios comunes),
+    así las diferencias entre escenarios no se deben al ruido del muestreo.
+    Las columnas que falten en df_escenarios toman el valor base de `variables`.
+    Devuelve los parámetros de cada escenario con la media, desviación y percentiles del WACC.
+    """
+    base = parametros_base(variables)
+    parametros = df_escenarios.copy()
+    for columna, valor in base.items():
+        if columna not in parametros.columns:
+            parametros[columna] = valor
+        else:
+            parametros[columna] = parametros[columna].fillna(valor)
+
+    u = np.random.default_rng(semilla).random((n_sorteos, len(variables)))
+    medias, desviaciones, cuantiles = [], [], []
+    for inicio in range(0, len(parametros), escenarios_por_bloque):
+        p = parametros.iloc[inicio:inicio + escenarios_por_bloque]
+        # (escenarios, 1) con (1, sorteos) -> (escenarios, sorteos)
+        insumos = [transformar_normal_truncada(u[:, j][np.newaxis, :],
+                                               p[col_media].to_numpy(dtype=float)[:, np.newaxis],
+                                               p[col_volatilidad].to_numpy(dtype=float)[:, np.newaxis],
+                                               *limites)
+                   for j, ((col_media, col_volatilidad), (_, _, limites))
+                   in enumerate(zip(COLUMNAS_ESCENARIO, variables.values()))]
+        wacc = calcular_wacc(*insumos)
+        medias.append(wacc.mean(axis=1))
+        desviaciones.append(wacc.std(axis=1, ddof=1))
+        cuantiles.append(np.percentile(wacc, percentiles, axis=1).T)
+
+    resultados = parametros.reset_index(drop=True)
+    resultados['WACC_media'] = np.concatenate(medias)
+    resultados['WACC_desviacion'] = np.concatenate(desviaciones)
+    for k, p in enumerate(percentiles):
+        resultados[f'WACC_p{p:g}'] = np.vstack(cuantiles)[:, k]
+    return resultados
+
+
+def escenarios_tornado(variables, variacion=0.20):
+    """Escenario base y, por cada parámetro, un escenario bajo (-variacion) y uno alto (+variacion)."""
+    base = parametros_base(variables)
+    filas = [{'Parametro': 'Base', 'Nivel': 'Base', **base}]
+    for columna, valor in base.items():
+        filas.append({'Parametro': columna, 'Nivel': 'Bajo', **base, columna: valor * (1 - variacion)})
+        filas.append({'Parametro': columna, 'Nivel': 'Alto', **base, columna: valor * (1 + variacion)})
+    return pd.DataFrame(filas)
+
+
+def graficar_tornado(df_tornado, archivo_png, variacion=0.20, medida='WACC_media'):
+    """Diagrama de tornado: barras ordenadas por el rango de la medida entre el nivel bajo y el alto."""
+    valor_base = df_tornado.loc[df_tornado['Nivel'] == 'Base', medida].iloc[0]
+    tabla = df_tornado[df_tornado['Nivel'] != 'Base'].pivot(index='Parametro', columns='Nivel', values=medida)
+    tabla = tabla.loc[(tabla['Alto'] - tabla['Bajo']).abs().sort_values().index]
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    posiciones = np.arange(len(tabla))
+    ax.barh(posiciones, tabla['Bajo'] - valor_base, left=valor_base, color='#fa8072',
+            edgecolor='black', linewidth=0.5, label=f'Parámetro -{variacion:.0%}')
+    ax.barh(posiciones, tabla['Alto'] - valor_base, left=valor_base, color='#1f49fa',
+            edgecolor='black', linewidth=0.5, label=f'Parámetro +{variacion:.0%}')
+    ax.axvline(valor_base, color='black', linestyle='--', alpha=0.7)
+    ax.set_yticks(posiciones)
+    ax.set_yticklabels(tabla.index)
+    ax.set_title(f'Sensibilidad del WACC (base {valor_base:.2%})', fontsize=14, fontweight='bold')
+    ax.set_xlabel('WACC medio (%)', fontsize=12)
+    ax.xaxis.set_major_formatter(mtick.PercentFormatter(xmax=1, decimals=2))
+    ax.grid(axis='x', alpha=0.3)
+    ax.legend(loc='lower right')
+    plt.savefig(archivo_png, dpi=300, bbox_inches='tight')
+    plt.close()
+
+# ==============================================================================
+# 6. SECCIÓN DE VARIABLES (INPUTS)
 # ==============================================================================
 # --- Parámetros de la Simulación ---
 n_iteraciones = 5000       
 certeza_deseada = 95.0     
+tamano_bloque = 1_000_000  # Sorteos por bloque: fija la memoria usada, no el total de iteraciones
 
 # --- Datos Financieros ---
 rf_base     = 0.0375    # Tasa Libre de Riesgo
@@ -43,102 +886,217 @@ volatilidad_beta = 0.2055
 volatilidad_rm   = 0.0200  # Ajusté un poco esto (antes tenias 0.20 que es 20%, muy alto)
 volatilidad_rp   = 0.0025  
 
-# ==============================================================================
-# 3. CONFIGURACIÓN DE RUTAS
-# ==============================================================================
-base_dir = os.getcwd()
-input_folder = os.path.join(base_dir, 'Flujo', 'input')
-output_folder = os.path.join(base_dir, 'Flujo', 'output')
+# --- Límites de truncamiento (mínimo, máximo) de cada variable ---
+# Equivale a 'Min' y 'Max' de Crystal Ball. Usar np.inf si no hay máximo.
+limites_rf   = (0.0, np.inf)
+limites_beta = (0.0, np.inf)
+limites_rm   = (0.0, np.inf)
+limites_rp   = (0.0, np.inf)
 
-os.makedirs(input_folder, exist_ok=True)
-os.makedirs(output_folder, exist_ok=True)
+# --- Ejecución ---
+semilla = 42                 # Semilla raíz: cada bloque recibe un flujo independiente derivado de ella
+n_procesos = os.cpu_count()  # 1 = sin paralelismo; el resultado no depende de este valor
 
-fecha_hora = datetime.now().strftime("%Y%m%d_%H%M%S")
-archivo_excel = os.path.join(output_folder, f'estadistica_WACC_{fecha_hora}.xlsx')
-archivo_png   = os.path.join(output_folder, f'grafico_WACC_{fecha_hora}.png')
+# --- Muestreo ---
+metodo_muestreo = 'pseudoaleatorio'  # 'pseudoaleatorio', 'sobol' o 'latin' (baja discrepancia)
 
-print(f"--- Iniciando Simulación (Solo Positivos - Truncada) ---")
+# Motor: 'numpy' (arreglos por bloque) o 'fusionado' (un solo bucle con numba si está
+# instalado, o NumPy in situ si no). 'fusionado' requiere muestreo pseudoaleatorio sin reducción.
+motor_calculo = 'numpy'
 
-# ==============================================================================
-# 4. CÁLCULOS (MONTECARLO)
-# ==============================================================================
-np.random.seed(42)
+# Reducción de varianza: 'ninguna', 'antiteticas', 'variable_control' o 'estratificado' (sobre Beta)
+tecnica_reduccion = 'ninguna'
 
-# Usamos la nueva función en lugar de np.random.normal directo
-rf_simulada   = generar_normal_positiva(rf_base, volatilidad_rf, n_iteraciones)
-beta_simulada = generar_normal_positiva(beta_base, volatilidad_beta, n_iteraciones)
-rm_simulada   = generar_normal_positiva(rm_base, volatilidad_rm, n_iteraciones)
-rp_simulada   = generar_normal_positiva(riesgo_pais, volatilidad_rp, n_iteraciones)
+# Modo adaptativo: ignora n_iteraciones y agrega lotes hasta que el semiancho del
+# intervalo de confianza de la media y de los límites de certeza sea < tolerancia_wacc
+modo_adaptativo = False
+tolerancia_wacc = 0.0001      # 0.01% (1 punto básico)
+tamano_lote = 2**14           # Potencia de 2 para conservar el balance de Sobol
+max_iteraciones = 10_000_000
 
-# Fórmula WACC
-wacc_simulado = (rf_simulada + beta_simulada*(1+(1-0.295)*(0.0818/0.78967)) * (rm_simulada - rf_simulada + rp_simulada))*0.78967 + (1-0.295)*0.2104*0.0818 
+# Compara el muestreo por rechazo con la CDF inversa antes de simular
+ejecutar_benchmark = False
+# Mide el tiempo con 1..n_procesos procesos antes de simular
+ejecutar_escalamiento = False
+# Compara cuántas iteraciones necesita cada método de muestreo para tolerancia_wacc
+ejecutar_comparacion_muestreo = False
+# Compara el motor NumPy con el núcleo fusionado
+ejecutar_benchmark_nucleo = False
 
-print(f"Promedio WACC simulado: {np.mean(wacc_simulado):.2%}")
+variables_simuladas = {
+    'Tasa_Libre_Riesgo':   (rf_base, volatilidad_rf, limites_rf),
+    'Beta':                (beta_base, volatilidad_beta, limites_beta),
+    'Rendimiento_Mercado': (rm_base, volatilidad_rm, limites_rm),
+    'Riesgo_Pais':         (riesgo_pais, volatilidad_rp, limites_rp),
+}
 
-# ==============================================================================
-# 5. GUARDAR DATOS EN EXCEL
-# ==============================================================================
-df_resultados = pd.DataFrame({
-    'Tasa_Libre_Riesgo': rf_simulada,
-    'Beta': beta_simulada,
-    'Rendimiento_Mercado': rm_simulada,
-    'Riesgo_Pais': rp_simulada,
-    'WACC_Simulado': wacc_simulado
-})
+# --- Sensibilidad ---
+# Evalúa muchos escenarios de parámetros en un solo cálculo y genera el diagrama de tornado.
+# Los escenarios salen de archivo_escenarios (Excel en Flujo/input con columnas como rf_base,
+# beta_base, rm_base, riesgo_pais, volatilidad_rf, ...) o, si es None, de grilla_sensibilidad.
+modo_sensibilidad = False
+archivo_escenarios = None
+grilla_sensibilidad = {
+    'beta_base': np.linspace(0.30, 0.70, 41),
+    'rm_base':   np.linspace(0.06, 0.10, 41),
+}
+variacion_tornado = 0.20       # ±20% sobre cada parámetro base
+n_sorteos_sensibilidad = 2000  # Sorteos por escenario
 
-with pd.ExcelWriter(archivo_excel) as writer:
-    df_resultados.to_excel(writer, sheet_name='Datos', index=False)
-    df_resultados.describe().to_excel(writer, sheet_name='Estadisticas')
+# --- Sorteos individuales ---
+# Se guardan en formato columnar (no en Excel): 'npy' (un .npy por columna, se abre con
+# memmap), 'parquet' (requiere pyarrow) o None para no guardarlos. Al Excel solo van el
+# resumen y los percentiles. No aplica al modo adaptativo ni al motor 'fusionado'.
+formato_sorteos = 'npy'
+guardar_sorteos = formato_sorteos is not None and not modo_adaptativo and motor_calculo == 'numpy'
+percentiles_certeza = ((100 - certeza_deseada) / 2, 100 - (100 - certeza_deseada) / 2)
 
-print(f"Excel guardado en: {archivo_excel}")
+# Protección necesaria para los procesos hijos (en Windows re-importan este script)
+if __name__ == '__main__':
 
-# ==============================================================================
-# 6. GENERAR Y GUARDAR GRÁFICO (PNG)
-# ==============================================================================
-print("Generando gráfico...")
-fig, ax = plt.subplots(figsize=(10, 7))
-
-# Límites
-lim_inf = np.percentile(wacc_simulado, (100 - certeza_deseada) / 2)
-lim_sup = np.percentile(wacc_simulado, 100 - (100 - certeza_deseada) / 2)
-media_val = np.mean(wacc_simulado)
-
-# Histograma
-counts, bins, bars = ax.hist(wacc_simulado, bins=50, edgecolor='black', linewidth=0.5)
-
-# Colorear
-for bar in bars:
-    centro = bar.get_x() + bar.get_width() / 2
-    if lim_inf <= centro <= lim_sup:
-        bar.set_facecolor('#1f49fa')
-        bar.set_alpha(0.9)
+    # ==============================================================================
+    # 7. CONFIGURACIÓN DE RUTAS
+    # ==============================================================================
+    base_dir = os.getcwd()
+    input_folder = os.path.join(base_dir, 'Flujo', 'input')
+    output_folder = os.path.join(base_dir, 'Flujo', 'output')
+
+    os.makedirs(input_folder, exist_ok=True)
+    os.makedirs(output_folder, exist_ok=True)
+
+    fecha_hora = datetime.now().strftime("%Y%m%d_%H%M%S")
+    archivo_excel = os.path.join(output_folder, f'estadistica_WACC_{fecha_hora}.xlsx')
+    archivo_png   = os.path.join(output_folder, f'grafico_WACC_{fecha_hora}.png')
+    ruta_sorteos  = os.path.join(output_folder, f'sorteos_WACC_{fecha_hora}')
+    archivo_sensibilidad = os.path.join(output_folder, f'sensibilidad_WACC_{fecha_hora}.xlsx')
+    archivo_tornado      = os.path.join(output_folder, f'tornado_WACC_{fecha_hora}.png')
+
+    print(f"--- Iniciando Simulación (Solo Positivos - Truncada) ---")
+
+    # ==============================================================================
+    # 8. CÁLCULOS (MONTECARLO)
+    # ==============================================================================
+    if ejecutar_benchmark:
+        benchmark_normal_truncada()
+    if ejecutar_escalamiento:
+        medir_escalamiento(variables_simuladas, n_iteraciones, tamano_bloque, n_procesos, semilla)
+    if ejecutar_comparacion_muestreo:
+        comparar_metodos_muestreo(variables_simuladas, tolerancia_wacc, percentiles_certeza, semilla, n_procesos)
+    if ejecutar_benchmark_nucleo:
+        benchmark_nucleo_fusionado(variables_simuladas, tamano_bloque=tamano_bloque, semilla=semilla)
+
+    df_convergencia = None
+    if modo_adaptativo:
+        # Lotes hasta alcanzar la precisión pedida
+        columnas, estadisticas, bocetos, estimador, df_convergencia = simular_wacc_adaptativo(
+            variables_simuladas, tolerancia_wacc, percentiles_certeza, tamano_lote, max_iteraciones,
+            semilla=semilla, n_procesos=n_procesos, metodo=metodo_muestreo, tecnica=tecnica_reduccion,
+            motor=motor_calculo)
+        n_iteraciones = estadisticas.n
+        print(df_convergencia.to_string(index=False))
+        print(f"Iteraciones necesarias: {n_iteraciones}")
     else:
-        bar.set_facecolor('#fa8072')
-        bar.set_alpha(0.8)
-
-# Etiquetas
-ax.set_title(f'Simulación WACC ({n_iteraciones} iteraciones)', fontsize=14, fontweight='bold')
-ax.set_xlabel('Costo de Capital (%)', fontsize=12)
-ax.set_ylabel('Frecuencia', fontsize=12)
-ax.xaxis.set_major_formatter(mtick.PercentFormatter(xmax=1, decimals=2))
-ax.grid(axis='y', alpha=0.3)
-
-# Textos inferiores
-ymax = max(counts)
-pos_y = -ymax * 0.22 
-estilo_caja = dict(boxstyle="round,pad=0.3", fc="white", ec="black")
-estilo_azul = dict(boxstyle="round,pad=0.3", fc="white", ec="blue")
-
-ax.text(lim_inf, pos_y, f'{lim_inf:.2%}', ha='center', va='top', bbox=estilo_caja, fontweight='bold')
-ax.text(lim_sup, pos_y, f'{lim_sup:.2%}', ha='center', va='top', bbox=estilo_caja, fontweight='bold')
-ax.text(media_val, pos_y, f'Certeza: {certeza_deseada:.0f}%', ha='center', va='top', bbox=estilo_azul, color='blue', fontweight='bold')
-
-# Líneas y ajustes
-ax.axvline(lim_inf, color='black', linestyle='--', alpha=0.5)
-ax.axvline(lim_sup, color='black', linestyle='--', alpha=0.5)
-plt.subplots_adjust(bottom=0.3)
-
-plt.savefig(archivo_png, dpi=300, bbox_inches='tight')
-plt.close()
-
-print(f"Gráfico PNG guardado en: {archivo_png}")
\ No newline at end of file
+        # Normal truncada + fórmula WACC evaluadas bloque a bloque (en paralelo si n_procesos > 1)
+        escritor = None
+        if guardar_sorteos:
+            escritor = crear_escritor_sorteos(formato_sorteos, ruta_sorteos,
+                                              list(variables_simuladas) + ['WACC_Simulado'], n_iteraciones)
+        columnas, estadisticas, bocetos, estimador = simular_wacc_por_bloques(
+            variables_simuladas, n_iteraciones, tamano_bloque, escritor=escritor,
+            semilla=semilla, n_procesos=n_procesos, metodo=metodo_muestreo, tecnica=tecnica_reduccion,
+            motor=motor_calculo)
+        if escritor is not None:
+            print(f"Sorteos guardados en: {escritor.ruta}")
+    boceto_wacc = bocetos[-1]
+
+    df_reduccion = estimador.resumen()
+    print(f"Promedio WACC simulado: {estimador.media:.2%}")
+    print(f"Reducción de varianza ({tecnica_reduccion}): factor {estimador.factor_reduccion:.2f}, "
+          f"tamaño efectivo de muestra {estimador.tamano_efectivo:,.0f}")
+
+    # ==============================================================================
+    # 9. GUARDAR RESUMEN EN EXCEL
+    # ==============================================================================
+    with pd.ExcelWriter(archivo_excel) as writer:
+        resumen_estadistico(columnas, estadisticas, bocetos).to_excel(writer, sheet_name='Estadisticas')
+        tabla_percentiles(columnas, bocetos).to_excel(writer, sheet_name='Percentiles')
+        df_reduccion.to_excel(writer, sheet_name='Reduccion_Varianza', index=False)
+        if df_convergencia is not None:
+            df_convergencia.to_excel(writer, sheet_name='Convergencia', index=False)
+
+    print(f"Excel guardado en: {archivo_excel}")
+
+    # ==============================================================================
+    # 10. GENERAR Y GUARDAR GRÁFICO (PNG)
+    # ==============================================================================
+    print("Generando gráfico...")
+    fig, ax = plt.subplots(figsize=(10, 7))
+
+    # Límites (desde el boceto de cuantiles, sin ordenar todos los sorteos)
+    lim_inf, lim_sup = boceto_wacc.percentil(percentiles_certeza)
+    media_val = estimador.media
+
+    # Histograma
+    conteos_hist, bordes_hist = boceto_wacc.histograma(bins=50)
+    counts, bins, bars = ax.hist(bordes_hist[:-1], bins=bordes_hist, weights=conteos_hist,
+                                 edgecolor='black', linewidth=0.5)
+
+    # Colorear
+    for bar in bars:
+        centro = bar.get_x() + bar.get_width() / 2
+        if lim_inf <= centro <= lim_sup:
+            bar.set_facecolor('#1f49fa')
+            bar.set_alpha(0.9)
+        else:
+            bar.set_facecolor('#fa8072')
+            bar.set_alpha(0.8)
+
+    # Etiquetas
+    ax.set_title(f'Simulación WACC ({n_iteraciones} iteraciones)', fontsize=14, fontweight='bold')
+    ax.set_xlabel('Costo de Capital (%)', fontsize=12)
+    ax.set_ylabel('Frecuencia', fontsize=12)
+    ax.xaxis.set_major_formatter(mtick.PercentFormatter(xmax=1, decimals=2))
+    ax.grid(axis='y', alpha=0.3)
+
+    # Textos inferiores
+    ymax = max(counts)
+    pos_y = -ymax * 0.22 
+    estilo_caja = dict(boxstyle="round,pad=0.3", fc="white", ec="black")
+    estilo_azul = dict(boxstyle="round,pad=0.3", fc="white", ec="blue")
+
+    ax.text(lim_inf, pos_y, f'{lim_inf:.2%}', ha='center', va='top', bbox=estilo_caja, fontweight='bold')
+    ax.text(lim_sup, pos_y, f'{lim_sup:.2%}', ha='center', va='top', bbox=estilo_caja, fontweight='bold')
+    ax.text(media_val, pos_y, f'Certeza: {certeza_deseada:.0f}%', ha='center', va='top', bbox=estilo_azul, color='blue', fontweight='bold')
+
+    # Líneas y ajustes
+    ax.axvline(lim_inf, color='black', linestyle='--', alpha=0.5)
+    ax.axvline(lim_sup, color='black', linestyle='--', alpha=0.5)
+    plt.subplots_adjust(bottom=0.3)
+
+    plt.savefig(archivo_png, dpi=300, bbox_inches='tight')
+    plt.close()
+
+    print(f"Gráfico PNG guardado en: {archivo_png}")
+
+    # ==============================================================================
+    # 11. SENSIBILIDAD (ESCENARIOS Y TORNADO)
+    # ==============================================================================
+    if modo_sensibilidad:
+        if archivo_escenarios:
+            df_escenarios = pd.read_excel(os.path.join(input_folder, archivo_escenarios), engine='openpyxl')
+        else:
+            df_escenarios = generar_grilla(**grilla_sensibilidad)
+        print(f"Evaluando {len(df_escenarios)} escenarios de sensibilidad...")
+
+        df_sensibilidad = evaluar_escenarios(df_escenarios, variables_simuladas, n_sorteos_sensibilidad,
+                                             percentiles_certeza, semilla)
+        df_tornado = evaluar_escenarios(escenarios_tornado(variables_simuladas, variacion_tornado),
+                                        variables_simuladas, n_sorteos_sensibilidad, percentiles_certeza, semilla)
+
+        with pd.ExcelWriter(archivo_sensibilidad) as writer:
+            df_sensibilidad.to_excel(writer, sheet_name='Escenarios', index=False)
+            df_tornado.to_excel(writer, sheet_name='Tornado', index=False)
+        graficar_tornado(df_tornado, archivo_tornado, variacion_tornado)
+
+        print(f"Sensibilidad guardada en: {archivo_sensibilidad}")
+        print(f"Gráfico de tornado guardado en: {archivo_tornado}")
\ No newline at end of file
@@ -1,10 +1,21 @@
 #Calculo para la determinación del WACC
 
 import os
+import sys
+import json
+import tempfile
 import pandas as pd
-from openpyxl import load_workbook
-from openpyxl.styles import NamedStyle
-from datetime import datetime 
+import numpy as np
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, Side
+from openpyxl.utils import get_column_letter
+from datetime import datetime
+from time import perf_counter
+
+# Agregar la carpeta padre al path para poder importar módulos desde allí
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Conexiones.lectura_excel import leer_excel
 
 # Obtener el directorio actual donde está el script de Python
 base_dir = os.getcwd()
@@ -12,56 +23,255 @@ base_dir = os.getcwd()
 # Ruta completa al archivo Excel en la subcarpeta Flujo/input
 Entrada = os.path.join(base_dir, 'Flujo', 'input', 'Datos-wacc.xlsx')
 
-# Cargar los datos desde el archivo Excel
-df = pd.read_excel(Entrada, engine='openpyxl')
+# Modo incremental: solo calcula las filas nuevas de la entrada y las agrega a un archivo acumulado
+# (CSV), recordando la última fecha procesada y sus valores en un archivo de estado
+modo_incremental = False
+archivo_acumulado = os.path.join(base_dir, 'Flujo', 'output', 'variacion_porcentual_wacc_acumulada.csv')
+archivo_estado = os.path.join(base_dir, 'Flujo', 'output', 'variacion_porcentual_wacc_estado.json')
+
+# Formatos de número del archivo de salida
+formato_porcentaje = '0.00%'
+formato_fecha = 'DD/MM/YYYY'  # Puedes ajustar el formato de fecha si es necesario
+
+# Compara la exportación anterior (pandas + estilos celda por celda) con la de una sola pasada
+ejecutar_benchmark = False
+filas_benchmark = 100_000
+
+# --- EXPORTACIÓN A EXCEL EN UNA SOLA PASADA ---
+
+def _formato_columna(serie, formato_fecha, formato_porcentaje):
+    """Formato de número de la columna: fecha, porcentaje (solo números) o None (sin formato)."""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return formato_fecha
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        return formato_porcentaje
+    return None
+
+
+def _valores_columna(serie):
+    """Valores de la columna como objetos de Python; NaN/NaT/inf quedan como None (celda vacía)."""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return [None if pd.isna(v) else v.to_pydatetime() for v in serie]
+    if pd.api.types.is_bool_dtype(serie):
+        return serie.tolist()
+    if pd.api.types.is_numeric_dtype(serie):
+        valores = serie.to_numpy(dtype=float)
+        return [v if ok else None for v, ok in zip(valores.tolist(), np.isfinite(valores).tolist())]
+    return [None if pd.isna(v) else v for v in serie]
+
+
+def exportar_variacion(df, ruta, formato_fecha='DD/MM/YYYY', formato_porcentaje='0.00%', hoja='Sheet1'):
+    """
+    Escribe el DataFrame en un .xlsx en una sola pasada con openpyxl en modo de solo
+    escritura (las filas van directo al archivo, sin volver a abrirlo). Cada columna tiene
+    su formato de número (fecha o porcentaje); los booleanos quedan como celdas lógicas.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(hoja)
+    formatos = [_formato_columna(df[col], formato_fecha, formato_porcentaje) for col in df.columns]
+    for j, formato in enumerate(formatos, start=1):
+        ws.column_dimensions[get_column_letter(j)].width = 12 if formato == formato_fecha else 10
+
+    delgado = Side(style='thin')
+    encabezado = []
+    for col in df.columns:
+        celda = WriteOnlyCell(ws, value=str(col))
+        celda.font = Font(bold=True)
+        celda.border = Border(left=delgado, right=delgado, top=delgado, bottom=delgado)
+        celda.alignment = Alignment(horizontal='center')
+        encabezado.append(celda)
+    ws.append(encabezado)
+
+    # Una celda con formato por columna que se reutiliza en cada fila: openpyxl la escribe
+    # al agregar la fila, así el estilo no se crea celda por celda
+    plantillas = {}
+    for j, formato in enumerate(formatos):
+        if formato is not None:
+            plantillas[j] = WriteOnlyCell(ws)
+            plantillas[j].number_format = formato
+
+    columnas = [_valores_columna(df[col]) for col in df.columns]
+    for fila in zip(*columnas):
+        celdas = list(fila)
+        for j, plantilla in plantillas.items():
+            if celdas[j] is not None:
+                plantilla.value = celdas[j]
+                celdas[j] = plantilla
+        ws.append(celdas)
+    wb.save(ruta)
+    return ruta
+
+
+def exportar_con_estilos_por_celda(df, ruta):
+    """Exportación anterior: pandas escribe, se vuelve a abrir y se aplica un NamedStyle a cada celda."""
+    df.to_excel(ruta, index=False, engine='openpyxl')
+    wb = load_workbook(ruta)
+    ws = wb.active
+    percentage_style = NamedStyle(name="percentage_style", number_format="0.00%")
+    date_style = NamedStyle(name="date_style", number_format="DD/MM/YYYY")
+    for col in range(2, len(df.columns) + 1):
+        for row in range(2, len(df) + 2):
+            ws.cell(row=row, column=col).style = percentage_style
+    for row in range(2, len(df) + 2):
+        ws.cell(row=row, column=1).style = date_style
+    wb.save(ruta)
+    return ruta
+
+
+def benchmark_exportacion(df, n_filas=100_000, repeticiones=1):
+    """
+    Mide la exportación anterior (doble escritura con estilos por celda) contra la de una
+    sola pasada, sobre `n_filas` filas armadas repitiendo las variaciones de `df`.
+    """
+    repetidas = np.resize(np.arange(len(df)), n_filas)
+    df_grande = df.iloc[repetidas].reset_index(drop=True)
+    df_grande['Fecha'] = pd.date_range(df['Fecha'].min(), periods=n_filas, freq='D')
+
+    filas = []
+    with tempfile.TemporaryDirectory() as carpeta:
+        for nombre, funcion in [('Pandas_y_estilos_por_celda', exportar_con_estilos_por_celda),
+                                ('Una_pasada', exportar_variacion)]:
+            ruta = os.path.join(carpeta, f'{nombre}.xlsx')
+            mejor = np.inf
+            for _ in range(repeticiones):
+                inicio = perf_counter()
+                funcion(df_grande, ruta)
+                mejor = min(mejor, perf_counter() - inicio)
+            filas.append({'Metodo': nombre, 'Segundos': mejor, 'MB': os.path.getsize(ruta) / 1e6})
+    df_benchmark = pd.DataFrame(filas)
+    df_benchmark['Aceleracion'] = df_benchmark['Segundos'].iloc[0] / df_benchmark['Segundos']
+    print(f"\n--- Benchmark exportación ({n_filas} filas x {df.shape[1]} columnas) ---")
+    print(df_benchmark.to_string(index=False))
+    return df_benchmark
+
+
+# --- VARIACIÓN PORCENTUAL ---
+
+def calcular_variacion(df):
+    """Variación porcentual (en decimal) de todas las columnas salvo 'Fecha'."""
+    # Hacemos una copia del DataFrame para mantener los datos originales intactos
+    df_variacion = df.copy()
+    for col in df.columns:
+        if col != 'Fecha':  # No calculamos la variación porcentual para la columna 'Fecha'
+            df_variacion[col] = df[col].pct_change()  # pct_change calcula la variación porcentual en formato decimal
+    return df_variacion
+
+
+def leer_estado(ruta):
+    """Estado de la última corrida incremental (None si no existe)."""
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def guardar_estado(ruta, df, filas_procesadas):
+    """Guarda la última fecha procesada, sus valores y cuántas filas de la entrada ya se leyeron."""
+    ultima = df.iloc[-1]
+    estado = {
+        'columnas': list(df.columns),
+        'filas_procesadas': int(filas_procesadas),
+        'ultima_fecha': ultima['Fecha'].isoformat(),
+        'ultimos_valores': [float(v) for v in ultima.drop('Fecha')],
+    }
+    # Se escribe a un temporal y se reemplaza, para no dejar un estado a medias
+    temporal = ruta + '.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(estado, f, indent=2)
+    os.replace(temporal, ruta)
+
+
+def leer_filas_excel(ruta, fila_inicial):
+    """
+    Encabezado y filas desde `fila_inicial` (numeración de Excel) de la primera hoja.
+    En modo de solo lectura openpyxl recorre el XML sin armar las celdas de las filas
+    anteriores, así el costo depende de las filas leídas y no de toda la historia.
+    """
+    wb = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        encabezado = next(ws.iter_rows(min_row=1, max_row=1, values_only=True))
+        filas = list(ws.iter_rows(min_row=fila_inicial, values_only=True))
+    finally:
+        wb.close()
+    # Las filas vacías que openpyxl entrega al final de la hoja no son datos
+    return pd.DataFrame(filas, columns=list(encabezado)).dropna(how='all').reset_index(drop=True)
 
-# Verifica que las columnas que tienes en el archivo son adecuadas para la variación porcentual
-print(df.head())  # Esto te ayudará a ver cómo están estructurados los datos
 
-# Asegúrate de que las fechas estén en formato datetime
-df['Fecha'] = pd.to_datetime(df['Fecha'])  # Asegúrate de que la columna 'Fecha' esté en formato datetime
+def actualizar_variacion_incremental(entrada, archivo_acumulado, archivo_estado):
+    """
+    Calcula la variación solo de las filas agregadas a la entrada desde la última corrida y
+    las añade al final del archivo acumulado. Se toma únicamente la última fila ya procesada
+    (base del primer pct_change nuevo) más las nuevas; si esa fila ya no coincide con el
+    estado guardado (historia editada o columnas distintas), se recalcula todo.
+    Devuelve las filas de variación agregadas.
+    """
+    estado = leer_estado(archivo_estado)
+    if estado is not None and os.path.exists(archivo_acumulado):
+        # Solo la última fila ya procesada (fila filas_procesadas + 1 de Excel, tras el encabezado)
+        # y las nuevas; la entrada cambia en cada corrida, así que aquí no se usa la caché
+        # (leería, hashearía y guardaría toda la historia cada vez)
+        df = leer_filas_excel(entrada, estado['filas_procesadas'] + 1)
+        df['Fecha'] = pd.to_datetime(df['Fecha'])
+        coincide = (
+            list(df.columns) == estado['columnas'] and len(df) > 0
+            and df['Fecha'].iloc[0] == pd.Timestamp(estado['ultima_fecha'])
+            and np.array_equal(df.iloc[0].drop('Fecha').to_numpy(dtype=float),
+                               np.array(estado['ultimos_valores'], dtype=float), equal_nan=True)
+        )
+        if not coincide:
+            print("La entrada cambió respecto al estado guardado. Se recalcula toda la historia.")
+            estado = None
+    else:
+        estado = None
 
-# Calculamos la variación porcentual de las variables
-df_variacion = df.copy()  # Hacemos una copia del DataFrame para mantener los datos originales intactos
+    if estado is None:
+        df = leer_excel(entrada)
+        df['Fecha'] = pd.to_datetime(df['Fecha'])
+        df_nuevas = calcular_variacion(df)
+        df_nuevas.to_csv(archivo_acumulado, index=False)
+        filas_previas = 0
+    else:
+        df_nuevas = calcular_variacion(df).iloc[1:]
+        if len(df_nuevas):
+            df_nuevas.to_csv(archivo_acumulado, mode='a', header=False, index=False)
+        filas_previas = estado['filas_procesadas'] - 1
 
-# Calculamos la variación porcentual solo para las columnas numéricas
-for col in df.columns:
-    if col != 'Fecha':  # No calculamos la variación porcentual para la columna 'Fecha'
-        df_variacion[col] = df[col].pct_change()  # pct_change calcula la variación porcentual en formato decimal
+    guardar_estado(archivo_estado, df, filas_previas + len(df))
+    return df_nuevas
 
-# Ver el DataFrame con la variación porcentual
-print(df_variacion.head())
 
-# Ahora, exportamos el DataFrame a un nuevo archivo Excel
-fecha_hora = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")  # Obtener la fecha y hora
-Resultado_variacion = os.path.join(base_dir, 'Flujo', 'output', f'variacion_porcentual_wacc_{fecha_hora}.xlsx')
+# Solo al ejecutar el script: importarlo (p. ej. para usar exportar_variacion) no escribe archivos
+if __name__ == '__main__':
+    if modo_incremental:
+        df_nuevas = actualizar_variacion_incremental(Entrada, archivo_acumulado, archivo_estado)
+        print(f'{len(df_nuevas)} filas nuevas agregadas a: {archivo_acumulado}')
+    else:
+        # Cargar los datos desde el archivo Excel
+        df = leer_excel(Entrada)
 
-# Exportar a un nuevo archivo Excel con las variaciones porcentuales (sin multiplicar por 100)
-df_variacion.to_excel(Resultado_variacion, index=False, engine='openpyxl')
+        # Verifica que las columnas que tienes en el archivo son adecuadas para la variación porcentual
+        print(df.head())  # Esto te ayudará a ver cómo están estructurados los datos
 
-# Cargar el archivo Excel exportado
-wb = load_workbook(Resultado_variacion)
-ws = wb.active
+        # Asegúrate de que las fechas estén en formato datetime
+        df['Fecha'] = pd.to_datetime(df['Fecha'])  # Asegúrate de que la columna 'Fecha' esté en formato datetime
 
-# Crear un estilo para el formato porcentaje
-percentage_style = NamedStyle(name="percentage_style", number_format="0.00%")
+        # Calculamos la variación porcentual de las variables
+        df_variacion = calcular_variacion(df)
 
-# Crear un estilo para el formato de fecha corta
-date_style = NamedStyle(name="date_style", number_format="DD/MM/YYYY")  # Puedes ajustar el formato de fecha si es necesario
+        # Ver el DataFrame con la variación porcentual
+        print(df_variacion.head())
 
-# Aplicar el estilo de porcentaje a las celdas que contienen variaciones porcentuales (todas excepto la columna 'Fecha')
-for col in range(2, len(df.columns) + 1):  # Comienza desde la columna 2 para omitir 'Fecha'
-    for row in range(2, len(df) + 2):  # Comienza desde la fila 2 para omitir encabezados
-        cell = ws.cell(row=row, column=col)
-        cell.style = percentage_style
+        if ejecutar_benchmark:
+            benchmark_exportacion(df_variacion, filas_benchmark)
 
-# Aplicar el formato de fecha corta a la columna 'Fecha'
-for row in range(2, len(df) + 2):  # Comienza desde la fila 2 para omitir encabezados
-    cell = ws.cell(row=row, column=1)  # Columna 1 es la columna 'Fecha'
-    cell.style = date_style
+        # Ahora, exportamos el DataFrame a un nuevo archivo Excel
+        fecha_hora = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")  # Obtener la fecha y hora
+        Resultado_variacion = os.path.join(base_dir, 'Flujo', 'output', f'variacion_porcentual_wacc_{fecha_hora}.xlsx')
 
-# Guardar el archivo con los nuevos formatos
-wb.save(Resultado_variacion)
+        # Exportar con las variaciones porcentuales (sin multiplicar por 100), formato de porcentaje
+        # y de fecha corta aplicados por columna al escribir
+        exportar_variacion(df_variacion, Resultado_variacion, formato_fecha, formato_porcentaje)
 
-# Confirmación
-print(f'Archivo exportado a: {Resultado_variacion}')
+        # Confirmación
+        print(f'Archivo exportado a: {Resultado_variacion}')